@@ -0,0 +1,242 @@
+"""SQLite backend storing the annotations of every video of a dataset in one database.
+
+Usage
+    python annotation_db.py import <root_dir> [--db PATH]
+    python annotation_db.py export <root_dir> [--db PATH]
+    python annotation_db.py stats <root_dir> [--db PATH]
+
+The database (``<root_dir>/annotations.db`` by default) has one ``annotations`` table with the columns of the csv
+files plus the video name, indexed by video, action and player. It is opened in WAL mode, so several annotators can
+read while one of them writes, and every edit is a transaction. ``import`` loads the per-video csv files (and their
+pending logs) into it and ``export`` writes them back. Once the database exists, the annotator saves edits to it
+instead of the csv files.
+"""
+import sys
+import sqlite3
+import hashlib
+import argparse
+import threading
+import os.path as osp
+
+import pandas as pd
+
+from annotation_store import ANNOTATIONS_COL_NAMES, AnnotationLog, list_annotation_files, OP_ADD, OP_DELETE
+
+DB_FILE = 'annotations.db'
+
+COL_TYPES = {'vidname': 'TEXT', 'action': 'TEXT', 'player_id': 'INTEGER', 'start_time_s': 'REAL',
+             'stop_time_s': 'REAL', 'start_frame': 'INTEGER', 'stop_frame': 'INTEGER', 'frame_coords': 'TEXT',
+             'x_raw': 'NUMERIC', 'y_raw': 'NUMERIC', 'track_coverage': 'REAL', 'box_w_mean': 'REAL',
+             'box_h_mean': 'REAL'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS annotations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    video TEXT NOT NULL,
+    {columns}
+);
+CREATE INDEX IF NOT EXISTS annotations_video ON annotations (video);
+CREATE INDEX IF NOT EXISTS annotations_action ON annotations (action);
+CREATE INDEX IF NOT EXISTS annotations_player ON annotations (player_id);
+""".format(columns=',\n    '.join('{} {}'.format(name, COL_TYPES[name]) for name in ANNOTATIONS_COL_NAMES))
+
+
+def db_path(root_dir):
+    return osp.join(root_dir, DB_FILE)
+
+
+def to_db_row(row):
+    """ Converts an annotation row to database values: text columns are stored as their string """
+    return [str(elem) if COL_TYPES[name] == 'TEXT' else elem for name, elem in zip(ANNOTATIONS_COL_NAMES, row)]
+
+
+class AnnotationDB(object):
+    """Annotations of every video of a dataset in a SQLite database.
+
+    Each thread gets its own connection. Writes wait up to ``timeout`` seconds for another annotator's transaction to
+    finish. WAL mode relies on shared memory, so every annotator must open the database from the same host.
+    """
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+            # databases created before columns were added to ANNOTATIONS_COL_NAMES
+            existing = {row[1] for row in conn.execute('PRAGMA table_info(annotations)')}
+            for name in ANNOTATIONS_COL_NAMES:
+                if name not in existing:
+                    conn.execute('ALTER TABLE annotations ADD COLUMN {} {}'.format(name, COL_TYPES[name]))
+
+    def connection(self):
+        """ Returns the connection of the calling thread """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def video(self, name):
+        """ Returns the annotations of video `name`, with the interface of an `AnnotationLog` """
+        return VideoAnnotations(self, name)
+
+    def load(self, name):
+        """ Returns (annotations_list, annotations_col_names) of video `name`, in insertion order """
+        cursor = self.connection().execute(
+            'SELECT {} FROM annotations WHERE video = ? ORDER BY id'.format(', '.join(ANNOTATIONS_COL_NAMES)), (name,))
+        return [list(row) for row in cursor], list(ANNOTATIONS_COL_NAMES)
+
+    def write_records(self, name, records):
+        """ Applies add and delete records of video `name` in one transaction """
+        insert = 'INSERT INTO annotations (video, {}) VALUES (?, {})'.format(
+            ', '.join(ANNOTATIONS_COL_NAMES), ', '.join('?' * len(ANNOTATIONS_COL_NAMES)))
+        # a row deleted by another annotator in the meantime matches nothing and is left deleted
+        delete = ('DELETE FROM annotations WHERE id = (SELECT id FROM annotations WHERE video = ? AND {} '
+                  'ORDER BY id LIMIT 1)').format(' AND '.join('{} IS ?'.format(col) for col in ANNOTATIONS_COL_NAMES))
+        with self.connection() as conn:
+            for record in records:
+                if record[0] == OP_ADD:
+                    conn.execute(insert, [name] + record[1:])
+                elif record[0] == OP_DELETE:
+                    conn.execute(delete, [name] + record[1:])
+
+    def replace_video(self, name, annotations_list):
+        """ Replaces all annotations of video `name` by `annotations_list`, in one transaction """
+        with self.connection() as conn:
+            self._replace_video(conn, name, annotations_list)
+
+    def update_video(self, name, update):
+        """Replaces the annotations of video `name` by `update(annotations_list, annotations_col_names)`.
+
+        The database is locked for writing from reading the annotations until they are replaced, so edits of other
+        annotators are not lost in between.
+        """
+        conn = self.connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            annotations_list, annotations_col_names = self.load(name)
+            self._replace_video(conn, name, update(annotations_list, annotations_col_names))
+
+    @staticmethod
+    def _replace_video(conn, name, annotations_list):
+        conn.execute('DELETE FROM annotations WHERE video = ?', (name,))
+        conn.executemany(
+            'INSERT INTO annotations (video, {}) VALUES (?, {})'.format(
+                ', '.join(ANNOTATIONS_COL_NAMES), ', '.join('?' * len(ANNOTATIONS_COL_NAMES))),
+            [[name] + to_db_row(row) for row in annotations_list])
+
+    def signature(self, name):
+        """ Returns a string identifying the current annotations of video `name`, changed by every edit """
+        digest = hashlib.sha1()
+        cursor = self.connection().execute(
+            'SELECT id, {} FROM annotations WHERE video = ? ORDER BY id'.format(', '.join(ANNOTATIONS_COL_NAMES)),
+            (name,))
+        for row in cursor:
+            digest.update(repr(row).encode())
+        return 'db:' + digest.hexdigest()
+
+    def videos(self):
+        """ Returns names of the videos having annotations """
+        return [name for name, in self.connection().execute('SELECT DISTINCT video FROM annotations ORDER BY video')]
+
+    def counts(self, by='video'):
+        """ Returns number of annotations per value of column `by` ('video', 'action' or 'player_id') as a dict """
+        if by not in ('video', 'action', 'player_id'):
+            raise ValueError("Cannot count annotations by {}".format(by))
+        cursor = self.connection().execute(
+            'SELECT {0}, COUNT(*) FROM annotations GROUP BY {0} ORDER BY {0}'.format(by))
+        return dict(cursor.fetchall())
+
+    def query(self, video=None, action=None, player_id=None):
+        """ Returns annotations matching every given filter, across videos, as a DataFrame """
+        filters = [(col, value) for col, value in (('video', video), ('action', action), ('player_id', player_id))
+                   if value is not None]
+        sql = 'SELECT video, {} FROM annotations'.format(', '.join(ANNOTATIONS_COL_NAMES))
+        if filters:
+            sql += ' WHERE ' + ' AND '.join('{} = ?'.format(col) for col, _ in filters)
+        return pd.read_sql_query(sql + ' ORDER BY video, id', self.connection(),
+                                 params=[value for _, value in filters])
+
+    def import_csv_dir(self, annotations_dir):
+        """ Replaces the annotations of every video having a csv (or log) in `annotations_dir` by its content """
+        num_rows = 0
+        for csv_path in list_annotation_files(annotations_dir):
+            annotations_list, _ = AnnotationLog(csv_path).load()
+            self.replace_video(osp.splitext(osp.basename(csv_path))[0], annotations_list)
+            num_rows += len(annotations_list)
+        return num_rows
+
+    def export_csv_dir(self, annotations_dir):
+        """ Writes the annotations of every video to `<annotations_dir>/<video>.csv`, discarding pending logs """
+        num_rows = 0
+        for name in self.videos():
+            annotations_list, annotations_col_names = self.load(name)
+            AnnotationLog(osp.join(annotations_dir, name + '.csv')).compact(annotations_list, annotations_col_names)
+            num_rows += len(annotations_list)
+        return num_rows
+
+
+class VideoAnnotations(object):
+    """ Annotations of one video of an `AnnotationDB`, with the interface `AnnotationWriter` expects of a log """
+
+    needs_compaction = False  # every edit is already a committed transaction
+
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+
+    @property
+    def location(self):
+        return '{}[{}]'.format(self.db.path, self.name)
+
+    def load(self):
+        return self.db.load(self.name)
+
+    @staticmethod
+    def add_record(row):
+        return [OP_ADD] + to_db_row(row)
+
+    @staticmethod
+    def delete_record(index, row):
+        """ Rows are deleted by value rather than position, which other annotators may have shifted """
+        return [OP_DELETE] + to_db_row(row)
+
+    def append(self, row):
+        self.write_records([self.add_record(row)])
+
+    def delete(self, index, row):
+        self.write_records([self.delete_record(index, row)])
+
+    def write_records(self, records):
+        self.db.write_records(self.name, records)
+
+    def compact(self, annotations_list=None, annotations_col_names=None):
+        if annotations_list is not None:
+            self.db.replace_video(self.name, annotations_list)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import, export or summarize the annotations database of a dataset')
+    parser.add_argument('command', choices=['import', 'export', 'stats'])
+    parser.add_argument('root_dir', help='directory containing the annotations folder')
+    parser.add_argument('--db', help='database path (default: <root_dir>/{})'.format(DB_FILE))
+    args = parser.parse_args(argv)
+
+    annotations_dir = osp.join(args.root_dir, 'annotations')
+    db = AnnotationDB(args.db or db_path(args.root_dir))
+    if args.command == 'import':
+        print("Imported {} annotations from {}".format(db.import_csv_dir(annotations_dir), annotations_dir))
+    elif args.command == 'export':
+        print("Exported {} annotations to {}".format(db.export_csv_dir(annotations_dir), annotations_dir))
+    else:
+        counts = db.counts('video')
+        print("{} annotations of {} videos".format(sum(counts.values()), len(counts)))
+        for action, count in db.counts('action').items():
+            print("  {:>8d} | {}".format(count, action))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
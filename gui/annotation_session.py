@@ -0,0 +1,64 @@
+from intervals import IntervalIndex
+from profiling import profiler
+from timecodes import get_time_seconds
+from validate_annotations import validate_row
+
+
+def normalize_click(mouse_x, mouse_y, video_rect):
+    """ Returns click (`mouse_x`, `mouse_y`) in coordinates [0, 1] of `video_rect` ([x1, y1, x2, y2]), None outside """
+    x1, y1, x2, y2 = video_rect
+    if not (x1 < mouse_x < x2 and y1 < mouse_y < y2):
+        return None
+    return (mouse_x - x1) / (x2 - x1), (mouse_y - y1) / (y2 - y1)
+
+
+class AnnotationSession(object):
+    """Annotation logic of one opened video, independent of the GUI.
+
+    Holds the video's `VideoData`, finds players under clicks, builds annotation rows, keeps the `IntervalIndex` of
+    `annotations_list` up to date and queues edits on an `AnnotationWriter`. It needs neither Qt nor a display, so
+    benchmarks and scripts can drive it like the annotator does.
+    """
+
+    def __init__(self, video_data, writer):
+        self.video_data = video_data
+        self.writer = writer
+        self.annotations_list = video_data.annotations_list
+        self.intervals = IntervalIndex.from_annotations(self.annotations_list)
+
+    def player_at(self, frame_num, x, y):
+        """ Returns id of the player under normalized point (`x`, `y`) of `frame_num`, or -1 """
+        with profiler.span('hit_test'):
+            return self.video_data.tracking_annotations.hit_test(
+                frame_num, x, y, self.video_data.vid_width, self.video_data.vid_height)
+
+    def make_row(self, action, player_id, start_time, stop_time, start_frame, stop_frame, frame_coords, x_raw, y_raw):
+        """Returns annotation row of `action` by `player_id`, between mm:ss times `start_time` and `stop_time`, with
+        the coverage and box size of the player's track over its frames"""
+        row = [self.video_data.name + '.mp4', action, int(player_id), get_time_seconds(start_time),
+               get_time_seconds(stop_time), start_frame, stop_frame, frame_coords, x_raw, y_raw]
+        with profiler.span('validate_row'):
+            return row + validate_row(self.video_data.tracking_annotations.tracks, row)
+
+    def add(self, row, append=None):
+        """Adds annotation `row` and queues it for saving.
+
+        `append` inserts it at the end of `annotations_list` (default: ``list.append``; the annotator passes its list
+        model's, which also updates the view). Returns (duplicates, overlaps) found by `IntervalIndex.conflicts`.
+        """
+        duplicates, overlaps = self.intervals.conflicts(self.annotations_list, row)
+        (append or self.annotations_list.append)(row)
+        self.intervals = self.intervals.appended(row, len(self.annotations_list) - 1)
+        self.writer.append(self.video_data.annotation_log, row)
+        return duplicates, overlaps
+
+    def delete(self, index, pop=None):
+        """ Deletes annotation `index` (removed from `annotations_list` by `pop`, as in `add`) and queues it """
+        row = (pop or self.annotations_list.pop)(index)
+        self.intervals = self.intervals.removed(index)
+        self.writer.delete(self.video_data.annotation_log, index, row)
+        return row
+
+    def compact(self):
+        """ Queues rewrite of the video's annotations with all their logged edits """
+        self.writer.compact(self.video_data.annotation_log)
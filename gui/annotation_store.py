@@ -0,0 +1,252 @@
+import io
+import os
+import csv
+import glob
+import time
+import hashlib
+import threading
+import os.path as osp
+from collections import defaultdict
+
+import pandas as pd
+
+ANNOTATIONS_COL_NAMES = ['vidname', 'action', 'player_id', 'start_time_s', 'stop_time_s',
+                         'start_frame', 'stop_frame', 'frame_coords', 'x_raw', 'y_raw',
+                         'track_coverage', 'box_w_mean', 'box_h_mean']
+
+# fixed column types of annotations read in bulk (frames are nullable: rows added without them are left empty)
+ANNOTATIONS_DTYPES = {'vidname': 'object', 'action': 'object', 'player_id': 'int64', 'start_time_s': 'float64',
+                      'stop_time_s': 'float64', 'start_frame': 'Int64', 'stop_frame': 'Int64', 'frame_coords': 'object',
+                      'x_raw': 'float64', 'y_raw': 'float64', 'track_coverage': 'float32', 'box_w_mean': 'float32',
+                      'box_h_mean': 'float32'}
+
+LOG_SUFFIX = '.log'
+OP_ADD = 'add'
+OP_DELETE = 'del'
+
+_path_locks = defaultdict(threading.RLock)
+_path_locks_lock = threading.Lock()
+
+
+def path_lock(path):
+    """ Returns the lock serializing reads and writes of annotation file `path` across threads """
+    with _path_locks_lock:
+        return _path_locks[osp.abspath(path)]
+
+
+def upgrade_columns(col_names):
+    """ Returns `col_names` followed by the columns of `ANNOTATIONS_COL_NAMES` it lacks, e.g. of an older csv """
+    return list(col_names) + [name for name in ANNOTATIONS_COL_NAMES if name not in col_names]
+
+
+def list_annotation_files(annotations_dir):
+    """ Lists annotations csv paths of every video in `annotations_dir`, including those only written to a log yet """
+    paths = set(glob.glob(osp.join(annotations_dir, '*.csv')))
+    paths.update(path[:-len(LOG_SUFFIX)] for path in glob.glob(osp.join(annotations_dir, '*.csv' + LOG_SUFFIX)))
+    return sorted(paths)
+
+
+def file_signature(path):
+    """ Returns a string identifying the current version of `path` ('none' if it does not exist) """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return 'none'
+    return '{}:{}:{}'.format(st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def content_signature(path):
+    """ Returns a string identifying the contents of `path` ('none' if it does not exist), kept by copies """
+    digest = hashlib.sha1()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return 'none'
+    return 'sha1:' + digest.hexdigest()
+
+
+def atomic_write_csv(path, rows, col_names):
+    """ Writes `rows` to `path` through a temporary file and a rename, so readers never see a partial file """
+    tmp_path = path + '.tmp'
+    df = pd.DataFrame(rows, columns=col_names)
+    with open(tmp_path, 'w', newline='') as f:
+        df.to_csv(f, index=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class AnnotationLog(object):
+    """Annotations of one video, stored as a compacted csv plus an append-only log of edits.
+
+    Adding an annotation appends one ``add`` record to ``<name>.csv.log`` and deleting one appends a ``del`` tombstone
+    holding its index, each flushed and fsynced, so an edit costs O(1) instead of rewriting the whole csv. The first
+    line of the log is a hash of the contents of the csv it applies to, which survives copying or moving the dataset.
+    Compaction rewrites the csv atomically, which changes its contents, so a log left behind by a crash during
+    compaction is recognized as already applied. Such a log is renamed aside (``<name>.csv.log.<time>.stale``), never
+    deleted, and a partially written last record is ignored until the next edit overwrites it.
+
+    ``load`` replays the log on top of the csv and returns the same rows ``pd.read_csv`` would return for the
+    equivalent fully rewritten csv. All methods may be called from any thread.
+    """
+
+    def __init__(self, csv_path, compact_every=200):
+        self.csv_path = csv_path
+        self.log_path = csv_path + LOG_SUFFIX
+        self.compact_every = compact_every
+        self.num_records = 0  # edits logged since last compaction
+        self._lock = path_lock(csv_path)
+
+    @property
+    def location(self):
+        """ Where edits are saved, identifying the log in the write queue and in error messages """
+        return self.csv_path
+
+    @property
+    def needs_compaction(self):
+        return self.num_records >= self.compact_every
+
+    def load(self):
+        """ Returns (annotations_list, annotations_col_names) after replaying pending edits """
+        with self._lock:
+            return self._load()
+
+    def _load(self):
+        records = self._read_log()
+        self.num_records = len(records)
+
+        if not records:
+            if not osp.exists(self.csv_path):
+                return [], list(ANNOTATIONS_COL_NAMES)
+            df = pd.read_csv(self.csv_path)
+            df = df.reindex(columns=upgrade_columns(df.columns))
+            return pd.Series.to_list(df), df.columns
+
+        if osp.exists(self.csv_path):
+            with open(self.csv_path, newline='') as f:
+                reader = csv.reader(f)
+                col_names = upgrade_columns(next(reader))  # records may hold columns the csv does not have yet
+                rows = list(reader)
+        else:
+            col_names, rows = list(ANNOTATIONS_COL_NAMES), []
+
+        for record in records:
+            if record[0] == OP_ADD:
+                rows.append(record[1:])
+            elif record[0] == OP_DELETE:
+                rows.pop(int(record[1]))
+
+        # re-parse through pandas so values get the same types as when reading a rewritten csv
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(col_names)
+        writer.writerows(rows)
+        buffer.seek(0)
+        df = pd.read_csv(buffer)
+        return pd.Series.to_list(df), df.columns
+
+    @staticmethod
+    def add_record(row):
+        """ Returns log record of a new annotation row """
+        return [OP_ADD] + [str(elem) for elem in row]
+
+    @staticmethod
+    def delete_record(index, row=None):
+        """ Returns log record (tombstone) of the deletion of the annotation at position `index` """
+        return [OP_DELETE, int(index)]
+
+    def append(self, row):
+        """ Logs a new annotation row """
+        self.write_records([self.add_record(row)])
+
+    def delete(self, index, row=None):
+        """ Logs deletion of the annotation at position `index` """
+        self.write_records([self.delete_record(index)])
+
+    def write_records(self, records):
+        """ Appends `records` to the log with a single write and fsync """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        with self._lock:
+            if not osp.exists(self.log_path):
+                writer.writerow(['base', content_signature(self.csv_path)])
+            writer.writerows(records)
+
+            with open(self.log_path, 'a+b') as f:
+                drop_partial_record(f)
+                f.write(buffer.getvalue().encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+            self.num_records += len(records)
+
+    def compact(self, annotations_list=None, annotations_col_names=None):
+        """Atomically rewrites the csv and discards the log.
+
+        The csv is rewritten with `annotations_list` if given, otherwise with the result of replaying the log (nothing
+        is done if there is no log).
+        """
+        with self._lock:
+            if annotations_list is None:
+                if not osp.exists(self.log_path):
+                    return
+                annotations_list, annotations_col_names = self._load()
+            atomic_write_csv(self.csv_path, annotations_list, annotations_col_names)
+            try:
+                os.remove(self.log_path)
+            except FileNotFoundError:
+                pass
+            self.num_records = 0
+
+    def _read_log(self):
+        """ Returns valid log records, setting stale logs aside and skipping a partially written last record """
+        if not osp.exists(self.log_path):
+            return []
+
+        with open(self.log_path, newline='', encoding='utf-8') as f:
+            text = f.read()
+
+        lines = list(csv.reader(io.StringIO(text[:text.rfind('\n') + 1])))
+        if not lines or not self._is_base(lines[0]):
+            # log was already folded into the csv by an interrupted compaction
+            self._set_aside()
+            return []
+        return lines[1:]
+
+    def _is_base(self, header):
+        """ Checks whether log `header` names the current csv """
+        if len(header) != 2 or header[0] != 'base':
+            return False
+        if header[1] == 'none' or header[1].startswith('sha1:'):
+            return header[1] == content_signature(self.csv_path)
+        return header[1] == file_signature(self.csv_path)  # logs written before contents were hashed
+
+    def _set_aside(self):
+        stale_path = '{}.{}.stale'.format(self.log_path, time.strftime('%Y%m%d-%H%M%S'))
+        try:
+            os.replace(self.log_path, stale_path)
+        except OSError as e:
+            print("Could not set stale log {} aside: {}".format(self.log_path, e))
+            return
+        print("{} does not apply to the current {}, moved to {}".format(self.log_path, self.csv_path, stale_path))
+
+
+def drop_partial_record(f):
+    """ Truncates log file `f` (opened in binary append mode) after its last complete record """
+    size = f.seek(0, os.SEEK_END)
+    if size == 0:
+        return
+    f.seek(size - 1)
+    if f.read(1) == b'\n':
+        return
+    end = size
+    while end > 0:  # only after a crash mid-write: scan back to the last newline
+        start = max(end - 4096, 0)
+        f.seek(start)
+        newline = f.read(end - start).rfind(b'\n')
+        if newline >= 0:
+            f.truncate(start + newline + 1)
+            return
+        end = start
+    f.truncate(0)
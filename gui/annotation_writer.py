@@ -0,0 +1,157 @@
+import time
+import threading
+from collections import OrderedDict
+
+from profiling import profiler
+
+COMPACT = 'compact'
+
+
+class AnnotationWriter(object):
+    """Write-behind queue saving annotation edits on a background thread.
+
+    Edits are queued per `AnnotationLog` (or `VideoAnnotations` of the database) and written by a worker thread, so the
+    GUI never waits on disk. The worker waits ``coalesce_delay`` seconds after being woken up so that a burst of edits
+    to one video ends up in a single write and fsync. Failed writes stay queued, are retried every ``retry_interval``
+    seconds and are reported through ``pop_errors`` so the GUI can display them.
+    """
+
+    def __init__(self, coalesce_delay=0.1, retry_interval=2.0):
+        self.coalesce_delay = coalesce_delay
+        self.retry_interval = retry_interval
+
+        self._pending = OrderedDict()  # log location -> (log, list of records and COMPACT markers)
+        self._errors = []
+        self._busy = False
+        self._writing = OrderedDict()  # the part of the queue being written by the worker
+        self._closed = False
+        self._cond = threading.Condition()
+        self._worker = threading.Thread(target=self._run, name='annotation-writer', daemon=True)
+        self._worker.start()
+
+    @property
+    def pending_count(self):
+        """ Number of queued edits not written to disk yet """
+        with self._cond:
+            return sum(len([item for item in items if item is not COMPACT]) for _, items in self._pending.values())
+
+    def append(self, log, row):
+        """ Queues addition of `row` to `log` """
+        self._put(log, log.add_record(row))
+
+    def delete(self, log, index, row):
+        """ Queues deletion of annotation `index` (`row`) of `log` """
+        self._put(log, log.delete_record(index, row))
+
+    def compact(self, log):
+        """ Queues compaction of `log`, after all edits queued so far """
+        self._put(log, COMPACT)
+
+    def pop_errors(self):
+        """ Returns and clears messages of write errors that occurred since the last call """
+        with self._cond:
+            errors, self._errors = self._errors, []
+        return errors
+
+    def flush(self, timeout=None):
+        """ Blocks until all queued edits are written (or failed), returns True if the queue was emptied """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._pending or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+                if self._errors and not self._busy:
+                    return False
+        return True
+
+    def wait_written(self, log, timeout=None):
+        """Blocks until the edits queued for `log` are written, returns False if some are still queued after `timeout`
+        seconds (e.g. writes keep failing).
+
+        Loading a log with edits still queued would miss them, and deletes made on that list would then log the wrong
+        indexes, so loaders wait for its queue first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while log.location in self._pending or log.location in self._writing:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def shutdown(self, timeout=10.0):
+        """ Flushes queued edits and stops the worker thread, returns True if nothing was left unwritten """
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        return flushed
+
+    def _put(self, log, item):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Annotation writer is shut down")
+            self._pending.setdefault(log.location, (log, []))[1].append(item)
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending:
+                    return
+            time.sleep(self.coalesce_delay)  # let a burst of edits accumulate
+
+            with self._cond:
+                pending, self._pending = self._pending, OrderedDict()
+                self._writing = pending
+                self._busy = True
+
+            failed = OrderedDict()
+            for location, (log, items) in pending.items():
+                try:
+                    self._write(log, items)
+                except Exception as e:
+                    failed[location] = (log, items)
+                    with self._cond:
+                        self._errors.append("could not save {}: {}".format(location, e))
+
+            with self._cond:
+                # failed edits go back in front of the queue, before edits made in the meantime
+                retry = bool(failed)
+                for location, (log, items) in self._pending.items():
+                    failed.setdefault(location, (log, []))[1].extend(items)
+                self._pending = failed
+                self._writing = OrderedDict()
+                self._busy = False
+                self._cond.notify_all()
+                if retry and not self._closed:
+                    self._cond.wait(self.retry_interval)
+                if retry and self._closed:
+                    return
+
+    @staticmethod
+    def _write(log, items):
+        """Writes queued `items` of `log` in order, merging consecutive records into one write.
+
+        Written items are removed from `items`, so that after a failure only the remaining ones are retried.
+        """
+        while items:
+            if items[0] is COMPACT:
+                with profiler.span('annotations_compact'):
+                    log.compact()
+                del items[0]
+                continue
+            n = next((i for i, item in enumerate(items) if item is COMPACT), len(items))
+            with profiler.span('annotations_write'):
+                log.write_records(items[:n])
+            del items[:n]
+        if log.needs_compaction:
+            with profiler.span('annotations_compact'):
+                log.compact()
@@ -1,19 +1,30 @@
+from startup import StartupReport, import_deferred_modules
+
 import os
 import sys
-import pandas as pd
+import argparse
+import functools
+import threading
 import os.path as osp
-import cv2
-import numpy as np
+
+from annotation_writer import AnnotationWriter
+from video_view import VideoView
+from list_models import SequenceListModel, RowListView, format_annotation, TRACK_COVERAGE_COL
+from timeline import TimelineStrip, action_colours
+from update_scheduler import UpdateScheduler
+from profiling import profiler, resident_memory, Throughput
+from hotkeys import DEFAULT_HOTKEYS_PATH, load_hotkeys, key_bindings
+from session_journal import SessionJournal, load_session
+from timecodes import get_time_string, get_time_seconds
 
 import PyQt5
 from PyQt5 import QtGui
-from PyQt5.QtGui import QIcon, QFont, QPalette, QPainter, QPixmap, QPen
-from PyQt5.QtCore import QDir, Qt, QUrl, QSize
+from PyQt5.QtGui import QIcon, QFont, QPalette, QPainter, QPixmap, QPen, QColor, QKeySequence
+from PyQt5.QtCore import QDir, Qt, QUrl, QSize, QTimer, pyqtSignal
 from PyQt5.QtMultimedia import QMediaContent, QMediaPlayer
-from PyQt5.QtMultimediaWidgets import QVideoWidget, QGraphicsVideoItem
 from PyQt5.QtWidgets import (QMainWindow, QApplication, QFileDialog, QHBoxLayout, QLabel, QSplitter,
                              QPushButton, QSizePolicy, QSlider, QStyle, QVBoxLayout, QWidget, QComboBox, QListWidget,
-                             QGraphicsScene, QGraphicsView, QGridLayout, QStatusBar)
+                             QGraphicsScene, QGraphicsView, QGridLayout, QStatusBar, QShortcut)
 
 
 class ActionAnnotator(QWidget):
@@ -39,10 +50,20 @@ class ActionAnnotator(QWidget):
 
     """
 
-    def __init__(self, classes_list, parent=None):
+    manifest_refreshed = pyqtSignal(object)  # Manifest rescanned in the background
+
+    def __init__(self, classes_list, proxy_height=None, journal=None, hotkeys=None, parent=None):
         super(ActionAnnotator, self).__init__(parent)
 
         self.classes_list = classes_list
+        self.proxy_height = proxy_height  # play videos higher than this from their low resolution proxy
+        self.journal = journal  # SessionJournal the in-progress state is saved to, if any
+        self.resume_position = None  # playback position to seek to once the resumed video is loaded
+
+        self.hotkeys = hotkeys or {}  # command -> keys overriding the defaults, see hotkeys.py
+        self.throughput = Throughput()  # annotations per minute of this session
+        self.added_rows = []  # annotations added to the current video, most recent last, for undo
+        self.action_colours = action_colours(classes_list)  # colour of each action on the timeline
 
         # Default appearance attributes
         self.button_size = QSize(16, 16)
@@ -53,16 +74,22 @@ class ActionAnnotator(QWidget):
 
         # Initialize video attributes
         self.fps = None
+        self.video_data = None  # VideoData of current video
         self.current_video_name = None
         self.current_video_path = None
         self.root_dir = None  # path to data/ directory
         self.videos_tracked_dir = None
         self.annotations_dir = None
         self.videos_list = None
+        self.manifest = None  # Manifest of the videos in `videos_tracked_dir`
         self.num_frames = None
         self.vid_height = None
         self.vid_width = None
-        self.tracking_annotations = None  # df containing tracking annotations
+        self.tracking_annotations = None  # TrackingIndex over the tracking .txt file
+        self.video_loader = None  # Prefetcher of VideoData, keyed by video name
+        self.annotation_db = None  # AnnotationDB, when the dataset has one
+        self.session = None  # AnnotationSession of current video
+        self.annotation_writer = AnnotationWriter()  # saves annotation edits in the background
         self.mouse_x = 0
         self.mouse_y = 0
         self.frame_geometry = None
@@ -75,8 +102,10 @@ class ActionAnnotator(QWidget):
         self.videos_title = QLabel('Videos List')
         # self.videos_description = QLabel('Select root directory containing "videos_tracked/" and "annoations/" folders')
         self.videos_title.setFont(self.title_font)
-        self.videos_qlist = QListWidget()
+        self.videos_model = SequenceListModel(formatter=self.format_video_row)
+        self.videos_qlist = RowListView(self.videos_model)
         self.videos_qlist.currentRowChanged.connect(self.set_video)
+        self.manifest_refreshed.connect(self.update_manifest)
 
         # Navigation buttons
         self.nav_next_btn = QPushButton('>')
@@ -176,11 +205,13 @@ class ActionAnnotator(QWidget):
         # *** 3. Annotations display pane ***
         self.annotations_title = QLabel('Annotations')
         self.annotations_title.setFont(self.title_font)
-        self.annotations_subtitle = QLabel('action, player_id, start_time (s), stop_time (s), start_frame, stop_frame')
+        self.annotations_subtitle = QLabel(
+            'action, player_id, start_time (s), stop_time (s), start_frame, stop_frame, coverage')
         self.annotations_subtitle.setFont(self.subtitle_font)
 
-        self.annotations_qlist = QListWidget()
-        self.annotations_qlist.itemClicked.connect(self.seek_video_to_annotation)
+        self.annotations_model = SequenceListModel(formatter=format_annotation)
+        self.annotations_qlist = RowListView(self.annotations_model)
+        self.annotations_qlist.clicked.connect(self.seek_video_to_annotation)
 
         self.delete_annotation_btn = QPushButton('delete')
         self.delete_annotation_btn.setEnabled(False)
@@ -198,8 +229,18 @@ class ActionAnnotator(QWidget):
 
         # 4. *** Video player pane ***
         self.media_player = QMediaPlayer(None, QMediaPlayer.VideoSurface)
-        self.video_widget = QVideoWidget(aspectRatioMode=1)
+        self.video_view = VideoView()  # video, stepped frames and tracking boxes overlay
+        self.overlay_frame = None  # frame whose boxes are drawn
 
+        # Stepped frames are shown from the frame server's buffer instead of seeking the media player
+        self.frame_server = None
+        self.stepped_frame = None  # frame shown by `video_view` in place of the video, None while playing the video
+
+        self.media_sync_timer = QTimer(self)
+        self.media_sync_timer.setSingleShot(True)
+        self.media_sync_timer.timeout.connect(self.sync_media_position)
+
+        self.duration_string = self.get_time_string(0)  # playback duration of current video, as mm:ss
         self.time_elapsed = QLabel('{:02d}:{:02d} / {:02d}:{:02d}  ||  {}  /  {}'.format(0, 0, 0, 0, 0, 0))
 
         self.play_button = QPushButton()
@@ -224,32 +265,104 @@ class ActionAnnotator(QWidget):
         self.playbackspeed_forward_5x_btn.clicked.connect(self.nnext_frame)
         self.playbackspeed_backward_5x_btn.clicked.connect(self.pprev_frame)
 
+        # Tracking boxes overlay toggle
+        self.overlay_btn = QPushButton('boxes')
+        self.overlay_btn.setCheckable(True)
+        self.overlay_btn.setChecked(True)
+        self.overlay_btn.toggled.connect(self.toggle_overlay)
+
+        # Navigation along the track of the selected player
+        self.track_first_btn = QPushButton('player |<')
+        self.track_prev_btn = QPushButton('player <')
+        self.track_next_btn = QPushButton('player >')
+        self.track_gaps_btn = QPushButton('gaps')
+        self.track_gaps_btn.setCheckable(True)
+        for btn in (self.track_first_btn, self.track_prev_btn, self.track_next_btn, self.track_gaps_btn):
+            btn.setEnabled(False)
+        self.track_first_btn.clicked.connect(self.seek_track_start)
+        self.track_prev_btn.clicked.connect(self.seek_previous_appearance)
+        self.track_next_btn.clicked.connect(self.seek_next_appearance)
+        self.track_gaps_btn.toggled.connect(self.update_track_gaps)
+
         self.position_slider = QSlider(Qt.Horizontal)
         self.position_slider.setRange(0, 0)
         self.position_slider.sliderMoved.connect(self.set_position)
 
+        # Annotation intervals under the slider
+        self.timeline = TimelineStrip()
+        self.timeline.frame_clicked.connect(self.seek_video_to_frame)
+
+        # Playback position updates, coalesced to the display rate. Consumers subscribe at their own rate.
+        self.position_updates = UpdateScheduler(parent=self)
+        self.position_updates.subscribe(self.update_playback_info)
+        self.position_updates.subscribe(lambda position: self.update_overlay())
+        self.position_updates.subscribe(lambda position: self.timeline.set_frame(self.current_frame()), 50)
+
         self.status_bar = QStatusBar()
         self.status_bar.setFont(self.subtitle_font)
         self.status_bar.setFixedHeight(14)
+        self.pending_writes_label = QLabel()
+        self.pending_writes_label.setFont(self.subtitle_font)
+        self.status_bar.addPermanentWidget(self.pending_writes_label)
+
+        self.write_status_timer = QTimer(self)
+        self.write_status_timer.timeout.connect(self.update_write_status)
+        self.write_status_timer.start(250)
+
+        self.throughput_label = QLabel()
+        self.throughput_label.setFont(self.subtitle_font)
+        self.status_bar.addPermanentWidget(self.throughput_label)
+
+        # the journal thread writes the latest state at its own (lower) rate
+        self.journal_timer = QTimer(self)
+        self.journal_timer.timeout.connect(self.save_session_state)
+        if self.journal is not None:
+            self.journal_timer.start(1000)
+
+        # resident memory of the process and of the loaded videos
+        self.memory_label = QLabel()
+        self.memory_label.setFont(self.subtitle_font)
+        self.status_bar.addPermanentWidget(self.memory_label)
+        self.memory_timer = QTimer(self)
+        self.memory_timer.timeout.connect(self.update_memory_status)
+        self.memory_timer.start(2000)
+
+        # p50/p95 latencies of the slowest instrumented paths, with --profile
+        self.profile_label = QLabel()
+        self.profile_label.setFont(self.subtitle_font)
+        self.profile_timer = QTimer(self)
+        self.profile_timer.timeout.connect(self.update_profile_status)
+        if profiler.enabled:
+            self.status_bar.addPermanentWidget(self.profile_label)
+            self.profile_timer.start(1000)
 
         control_layout = QHBoxLayout()
         control_layout.setContentsMargins(0, 0, 0, 0)
         control_layout.addWidget(self.play_button)
         control_layout.addWidget(self.time_elapsed)
-        control_layout.addWidget(self.position_slider)
+        slider_layout = QVBoxLayout()
+        slider_layout.setSpacing(0)
+        slider_layout.addWidget(self.position_slider)
+        slider_layout.addWidget(self.timeline)
+        control_layout.addLayout(slider_layout)
 
         playback_layout = QHBoxLayout()
         playback_layout.addWidget(self.playbackspeed_backward_5x_btn)
         playback_layout.addWidget(self.playbackspeed_backward_btn)
         playback_layout.addWidget(self.playbackspeed_forward_btn)
         playback_layout.addWidget(self.playbackspeed_forward_5x_btn)
+        playback_layout.addWidget(self.overlay_btn)
+        playback_layout.addWidget(self.track_first_btn)
+        playback_layout.addWidget(self.track_prev_btn)
+        playback_layout.addWidget(self.track_next_btn)
+        playback_layout.addWidget(self.track_gaps_btn)
 
         control_and_playback_layout = QVBoxLayout()
         control_and_playback_layout.addLayout(playback_layout)
         control_and_playback_layout.addLayout(control_layout)
 
         video_layout = QVBoxLayout()
-        video_layout.addWidget(self.video_widget)
+        video_layout.addWidget(self.video_view)
         video_layout.addLayout(control_and_playback_layout)
         video_layout.addWidget(self.status_bar)
 
@@ -261,6 +374,7 @@ class ActionAnnotator(QWidget):
 
         self.setLayout(global_layout)
         self.init_media_player()
+        self.install_hotkeys()
 
     def mousePressEvent(self, QMouseEvent):
         """ Callback that sets `player_id` when a video is playing and click is within video player """
@@ -269,35 +383,63 @@ class ActionAnnotator(QWidget):
             return
 
         self.mouse_x, self.mouse_y = QMouseEvent.x(), QMouseEvent.y()
-        self.frame_geometry = self.video_widget.frameGeometry().getCoords()  # [x1, y1, x2, y2]
+        self.frame_geometry = self.video_view.frameGeometry().getCoords()  # [x1, y1, x2, y2], saved with annotations
+
+        from annotation_session import normalize_click  # deferred: pulls in numpy
 
-        # check if click is within video
-        if (self.frame_geometry[0] < self.mouse_x < self.frame_geometry[2] and
-                self.frame_geometry[1] < self.mouse_y < self.frame_geometry[2]):
+        # check if click is within the displayed (letterboxed) video, as boxes are drawn, and change to [0,1]
+        point = self.video_view.mapToScene(self.video_view.viewport().mapFromGlobal(QMouseEvent.globalPos()))
+        coords = normalize_click(point.x(), point.y(), self.video_view.video_rect().getCoords())
+        if coords is not None and self.session is not None:
             # turn on reset
             self.annotations_reset_btn.setEnabled(True)
 
-            # change to frame coordinates [0,1]
-            x = (self.mouse_x - self.frame_geometry[0]) / (self.frame_geometry[2] - self.frame_geometry[0])
-            y = (self.mouse_y - self.frame_geometry[1]) / (self.frame_geometry[3] - self.frame_geometry[1])
-
-            player_id = self.get_player_id((x, y))
+            player_id = self.get_player_id(coords)
             self.player_id.setText("{}".format(player_id))
+            self.throughput.activity()
             self.update_add_btn_status()
-
-    def keyPressEvent(self, key_id):
-        """ Callback controlling video playback """
-        if key_id.key() == Qt.Key_Right:
-            self.media_player.setPosition(self.media_player.position() + 500)
-
-        elif key_id.key() == Qt.Key_Left:
-            self.media_player.setPosition(self.media_player.position() - 500)
-
-        elif key_id.key() == Qt.Key_Enter or key_id.key() == Qt.Key_Return or key_id.key() == Qt.Key_Space:
+            self.update_track_nav()
+
+    def install_hotkeys(self):
+        """Binds the default keys, updated by `hotkeys`, to their command.
+
+        Window shortcuts take precedence over the focused widget, so keys work even when a list has the focus.
+        """
+        bindings = key_bindings(self.hotkeys, normalize=lambda key: QKeySequence(key).toString())
+        for key, (command, argument) in bindings.items():
+            shortcut = QShortcut(QKeySequence(key), self)
+            shortcut.setContext(Qt.WindowShortcut)
+            shortcut.activated.connect(functools.partial(self.run_hotkey, command, argument))
+
+    def run_hotkey(self, command, argument=None):
+        """ Runs hotkey `command`, if the buttons it stands for are enabled """
+        if self.video_data is None:
+            return
+        if command == 'play' and self.play_button.isEnabled():
             self.play()
+        elif command == 'seek_forward':
+            self.set_position(self.current_position() + 500)
+        elif command == 'seek_backward':
+            self.set_position(self.current_position() - 500)
+        elif command in ('next_frame', 'prev_frame', 'nnext_frame', 'pprev_frame'):
+            getattr(self, command)()
+        elif command == 'set_start' and self.start_time_btn.isEnabled():
+            self.set_start_time()
+        elif command == 'set_stop' and self.stop_time_btn.isEnabled():
+            self.set_stop_time()
+        elif command == 'commit' and self.annotations_add_btn.isEnabled():
+            self.add_annotation()
+        elif command == 'undo':
+            self.undo_annotation()
+        elif command == 'reset':
+            self.reset_input()
+        elif command == 'select_class' and argument < len(self.classes_list):
+            self.classes_qlist.setCurrentRow(argument)
 
     def set_position(self, position):
         """ Sets video playback position """
+        self.leave_frame_view()
+        profiler.begin('media_seek')
         self.media_player.setPosition(position)
 
     def handle_error(self):
@@ -307,9 +449,11 @@ class ActionAnnotator(QWidget):
 
     def init_media_player(self):
         """ Initializes media player widget """
-        self.media_player.setVideoOutput(self.video_widget)
+        self.media_player.setVideoOutput(self.video_view.video_item)
         self.media_player.stateChanged.connect(self.media_state_changed)
-        self.media_player.positionChanged.connect(self.position_changed)
+        self.media_player.setNotifyInterval(self.position_updates.timer.interval())
+        self.media_player.positionChanged.connect(self.media_position_changed)
+        self.media_player.mediaStatusChanged.connect(self.media_status_changed)
         self.media_player.durationChanged.connect(self.duration_changed)
         self.media_player.error.connect(self.handle_error)
         self.status_bar.showMessage("Ready")
@@ -325,23 +469,55 @@ class ActionAnnotator(QWidget):
 
     def get_player_id(self, coords):
         """ Gets player tracking id from corresponding tracking .txt file """
-        x, y = coords  # ints
-
-        curr_frame = self.get_frame_number(self.media_player.position(), self.fps)
-        for row in self.tracking_annotations:
-            frame_num, player_id, x1, y1, w, h = row[:6]  # int, int, floats
-
-            if int(frame_num) == curr_frame:
-                point_coords = [x, y]
-                box_coords = np.array([x1, y1, x1 + w, y1 + h]) / np.array(
-                    [self.vid_width, self.vid_height, self.vid_width, self.vid_height])
-
-                if box_coords[0] < point_coords[0] < box_coords[2] and box_coords[1] < point_coords[1] < box_coords[3]:
-                    # print("frame_num, player_id, box_coords, point_coords")
-                    # print(frame_num, player_id, box_coords, point_coords)
-                    return int(player_id)
-
-        return -1
+        x, y = coords  # normalized [0,1]
+
+        curr_frame = self.current_frame()
+        return self.session.player_at(curr_frame, x, y)
+
+    def current_frame(self):
+        """ Returns number of the frame currently displayed """
+        if self.stepped_frame is not None:
+            return self.stepped_frame
+        if self.video_data is None:
+            return 0
+        return self.video_data.frame_index.frame_at(self.media_player.position())
+
+    def current_position(self):
+        """ Returns playback position (ms) of the frame currently displayed """
+        if self.stepped_frame is not None:
+            return self.video_data.frame_index.position_of(self.stepped_frame)
+        return self.media_player.position()
+
+    def is_valid_video(self, name):
+        """ Checks whether video `name` can be opened, as far as the manifest knows """
+        entry = self.manifest.entries.get(name)
+        return entry is None or entry['valid']
+
+    def close_video(self):
+        """ Unloads the current video and disables the controls acting on it, e.g. when an invalid one is selected """
+        self.leave_frame_view()
+        self.media_player.stop()
+        self.media_player.setMedia(QMediaContent())
+        if self.video_data is not None:
+            from prefetch import cancel_background_builds  # deferred: pulls in pandas and cv2
+
+            cancel_background_builds()
+        if self.frame_server is not None:
+            self.frame_server.close()
+            self.frame_server = None
+        self.video_data = None
+        self.session = None
+        self.tracking_annotations = None
+        self.annotations_list = []
+        self.annotations_model.set_rows([])
+        self.timeline.clear()
+        self.video_view.clear_boxes()
+        self.overlay_frame = None
+        self.reset_input()
+        for btn in (self.play_button, self.playbackspeed_forward_btn, self.playbackspeed_backward_btn,
+                    self.playbackspeed_forward_5x_btn, self.playbackspeed_backward_5x_btn):
+            btn.setEnabled(False)
+        self.update_nav_clickers()
 
     def reset_input(self):
         """ Reset annotations pane after an annotation is added """
@@ -351,6 +527,7 @@ class ActionAnnotator(QWidget):
         self.stop_frame.setText('XX')
         self.player_id.setText('XX')
         self.update_add_btn_status()
+        self.update_track_nav()
         self.annotations_reset_btn.setEnabled(False)
 
     def nav_next(self):
@@ -377,26 +554,28 @@ class ActionAnnotator(QWidget):
 
     def set_start_time(self):
         """ Sets start time of action being annotated """
-        pos = self.media_player.position()  # milliseconds
+        pos = self.current_position()  # milliseconds
         self.start_time.setText(self.get_time_string(pos))
-        self.start_frame.setText(str(self.get_frame_number(self.media_player.position(), self.fps)))
+        self.start_frame.setText(str(self.current_frame()))
         self.update_add_btn_status()
         self.annotations_reset_btn.setEnabled(True)
+        self.throughput.activity()
 
     def set_stop_time(self):
         """ Sets stop time of action being annotated """
-        pos = self.media_player.position()  # milliseconds
+        pos = self.current_position()  # milliseconds
         self.stop_time.setText(self.get_time_string(pos))
-        self.stop_frame.setText(str(self.get_frame_number(self.media_player.position(), self.fps)))
+        self.stop_frame.setText(str(self.current_frame()))
         self.update_add_btn_status()
         self.annotations_reset_btn.setEnabled(True)
+        self.throughput.activity()
 
     def set_dirs(self):
         """ Sets `videos_tracked` and `annotation` directories """
 
         # open select folder dialog
-        self.videos_qlist.clear()
-        self.annotations_qlist.clear()
+        self.videos_model.set_rows([])
+        self.annotations_model.set_rows([])
         self.media_player.stop()
 
         # turn off nav clickers
@@ -404,67 +583,177 @@ class ActionAnnotator(QWidget):
         self.nav_next_btn.setEnabled(False)
 
         # load from user selection
-        self.root_dir = QFileDialog.getExistingDirectory(
-            self, 'Select root directory containing videos/ and annoations/')
+        self.open_root_dir(QFileDialog.getExistingDirectory(
+            self, 'Select root directory containing videos/ and annoations/'))
+
+    def open_root_dir(self, root_dir, video=None):
+        """ Opens dataset `root_dir` at `video` (default: its first video) """
+        self.root_dir = root_dir
         self.videos_tracked_dir = osp.join(self.root_dir, 'videos_tracked')
         self.annotations_dir = osp.join(self.root_dir, 'annotations')
 
         if not (osp.exists(self.videos_tracked_dir) and osp.exists(self.annotations_dir)):
             self.status_bar.showMessage("ERROR: invalid directory chosen")
         else:
-            # select first video and annotation
-            self.videos_list = os.listdir(self.videos_tracked_dir)
-            self.videos_list = [item for item in self.videos_list if '.' not in item]
-
-            self.videos_qlist.addItems(self.videos_list)
-            self.videos_qlist.setCurrentRow(0)
+            from prefetch import Prefetcher, load_video_data  # deferred: pulls in pandas and cv2
+            from manifest import Manifest
+            from annotation_db import AnnotationDB, db_path
+
+            # annotations are saved to the dataset's database instead of csv files once it was created
+            self.annotation_db = AnnotationDB(db_path(self.root_dir)) if osp.exists(db_path(self.root_dir)) else None
+
+            if self.video_loader is not None:
+                self.video_loader.shutdown()
+            self.video_loader = Prefetcher(
+                functools.partial(load_video_data, self.videos_tracked_dir, self.annotations_dir,
+                                  annotation_db=self.annotation_db, proxy_height=self.proxy_height,
+                                  annotation_writer=self.annotation_writer))
+
+            # list videos from the last manifest (or a plain listing the first time), then rescan in the background
+            self.manifest = Manifest.load(self.root_dir)
+            if self.manifest.entries:
+                self.videos_list = self.manifest.names
+            else:
+                with os.scandir(self.videos_tracked_dir) as it:
+                    self.videos_list = sorted(e.name for e in it if '.' not in e.name)
+            threading.Thread(target=self.refresh_manifest, args=(self.manifest,), daemon=True).start()
+
+            # select first (or resumed) video and annotation
+            self.videos_model.set_rows(self.videos_list)
+            self.videos_qlist.setCurrentRow(self.videos_list.index(video) if video in self.videos_list else 0)
 
             self.set_video()
             self.update_nav_clickers()
 
-            self.start_time_btn.setEnabled(True)
-            self.stop_time_btn.setEnabled(True)
             self.delete_annotation_btn.setEnabled(True)
 
+    def refresh_manifest(self, manifest):
+        """ Rescans the dataset of `manifest` and saves it (runs on a background thread) """
+        try:
+            manifest = manifest.refresh()
+            manifest.save()
+        except Exception as e:
+            manifest = e
+        self.manifest_refreshed.emit(manifest)
+
+    def update_manifest(self, manifest):
+        """ Updates the videos list with a rescanned manifest, keeping the current video selected """
+        if isinstance(manifest, Exception):
+            self.status_bar.showMessage("ERROR: could not scan videos: {}".format(manifest))
+            return
+        if manifest.root_dir != self.root_dir:
+            return  # another directory was opened in the meantime
+
+        self.manifest = manifest
+        if manifest.names == self.videos_list:
+            self.videos_model.refresh()
+            return
+
+        index = self.videos_qlist.currentRow()
+        current_name = self.videos_list[index] if index >= 0 else None
+        self.videos_list = manifest.names
+        self.videos_qlist.blockSignals(True)
+        self.videos_model.set_rows(self.videos_list)
+        if current_name in self.videos_list:
+            self.videos_qlist.setCurrentRow(self.videos_list.index(current_name))
+        self.videos_qlist.blockSignals(False)
+        self.update_nav_clickers()
+
+    def format_video_row(self, name):
+        """ Formats a row of the videos list from its manifest entry """
+        from manifest import format_video_entry
+        return format_video_entry(name, self.manifest.entries.get(name) if self.manifest is not None else None)
+
+    def update_annotation_count(self):
+        """ Shows number of annotations of current video in the videos list """
+        index = self.videos_qlist.currentRow()
+        entry = self.manifest.entries.get(self.videos_list[index]) if index >= 0 else None
+        if entry is not None:
+            entry['num_annotations'] = len(self.annotations_list)
+            self.videos_model.refresh(index, index)
+
     def set_video(self):
         """Updates variables when new video is selected. Also updates and displays and its corresponding annot file"""
 
-        # update video
-        self.current_video_name = self.videos_list[self.videos_qlist.currentRow()] + '.mp4'
-        self.current_video_path = osp.join(
-            self.videos_tracked_dir, self.current_video_name.split('.')[0], self.current_video_name)
-        cap_vid_tracked = cv2.VideoCapture(self.current_video_path)
-        self.fps = cap_vid_tracked.get(cv2.CAP_PROP_FPS)
-        self.num_frames = int(cap_vid_tracked.get(cv2.CAP_PROP_FRAME_COUNT))
-        self.vid_height = cap_vid_tracked.get(cv2.CAP_PROP_FRAME_HEIGHT)
-        self.vid_width = cap_vid_tracked.get(cv2.CAP_PROP_FRAME_WIDTH)
-
-        # read tracking data for this video (for efficiency change to json/dict)
-        tracking_results_txt_path = osp.join(self.videos_tracked_dir, self.current_video_name.split('.')[0],
-                                             self.current_video_name.split('.')[0] + '.txt')
-        df = pd.read_csv(tracking_results_txt_path)
-        self.tracking_annotations = pd.Series.to_list(df)
-
-        # Load annotations file if they already exist
-        self.annotations_qlist.clear()
-        if osp.exists(osp.join(self.annotations_dir, self.current_video_name.split('.')[0] + '.csv')):
-            df = pd.read_csv(osp.join(self.annotations_dir, self.current_video_name.split('.')[0] + '.csv'))
-            self.annotations_list = pd.Series.to_list(df)
-            annotation_strings = [' '.join([str(elem) + ", " for elem in row[1:-3]])[:-2]
-                                  for row in self.annotations_list]
-            self.annotations_qlist.addItems(annotation_strings)
-            self.annotations_qlist.setCurrentRow(0)
-            self.annotations_col_names = df.columns
-
-        else:
-            self.annotations_col_names = ['vidname', 'action', 'player_id', 'start_time_s', 'stop_time_s',
-                                          'start_frame', 'stop_frame', 'frame_coords', 'x_raw', 'y_raw']
-            self.annotations_list = []
+        # flush edits of previous video and fold them into its csv
+        self.compact_annotations()
+        self.resume_position = None
+        self.added_rows = []
 
+        # update video (loaded in the background when it was prefetched)
+        index = self.videos_qlist.currentRow()
+        if index < 0:
+            return
+        valid = self.is_valid_video(self.videos_list[index])
+        self.start_time_btn.setEnabled(valid)
+        self.stop_time_btn.setEnabled(valid)
+        if not valid:
+            self.close_video()
+            self.status_bar.showMessage(
+                "ERROR: " + ', '.join(self.manifest.entries[self.videos_list[index]]['errors']))
+            return
+        try:
+            with profiler.span('load_video'):
+                video_data = self.video_data = self.video_loader.get(self.videos_list[index])
+        except Exception as e:
+            # not in the manifest yet (first open, new folder) or broken since the last scan
+            self.start_time_btn.setEnabled(False)
+            self.stop_time_btn.setEnabled(False)
+            self.close_video()
+            self.status_bar.showMessage("ERROR: could not open {}: {}".format(self.videos_list[index], e))
+            return
+        # probe and transcode the opened video only, stopping those of the videos left
+        from prefetch import cancel_background_builds  # deferred: pulls in pandas and cv2
+
+        cancel_background_builds(keep=video_data.video_path)
+        video_data.start_builds()
+        self.current_video_name = video_data.name + '.mp4'
+        self.current_video_path = video_data.video_path
+        self.fps = video_data.fps
+        self.num_frames = video_data.num_frames
+        self.vid_height = video_data.vid_height
+        self.vid_width = video_data.vid_width
+        self.tracking_annotations = video_data.tracking_annotations
+
+        # display annotations file if it already exists
+        from annotation_session import AnnotationSession  # deferred: pulls in numpy
+
+        self.session = AnnotationSession(video_data, self.annotation_writer)
+        self.annotations_list = video_data.annotations_list
+        self.annotations_col_names = video_data.annotations_col_names
+        self.annotations_model.set_rows(self.annotations_list)
+        if self.annotations_list:
+            self.annotations_qlist.setCurrentRow(0)
+        self.update_timeline()
+        self.update_track_nav()
+
+        # load neighbouring videos ahead of navigation
+        neighbours = [i for i in (index + 1, index - 1)
+                      if 0 <= i < len(self.videos_list) and self.is_valid_video(self.videos_list[i])]
+        self.video_loader.prefetch([self.videos_list[i] for i in neighbours])
+
+        from frame_server import FrameServer  # deferred: pulls in cv2
+
+        self.leave_frame_view()
+        if self.frame_server is not None:
+            self.frame_server.close()
+        # the proxy, if any, is played and decoded; boxes and clicks stay in the original video's pixel space
+        self.frame_server = FrameServer(video_data.playback_path, video_data.playback_width,
+                                        video_data.playback_height, self.num_frames)
+        self.video_view.set_source_size(self.vid_width, self.vid_height)
+        self.overlay_frame = None
+        self.position_updates.invalidate()
+        self.update_overlay()
+
+        profiler.begin('media_load')
         self.media_player.setMedia(
-            QMediaContent(QUrl.fromLocalFile(self.current_video_path)))
+            QMediaContent(QUrl.fromLocalFile(video_data.playback_path)))
         self.play_button.setEnabled(True)
-        self.status_bar.showMessage(osp.join(self.current_video_path))
+        if video_data.playback_path != self.current_video_path:
+            self.status_bar.showMessage("{} (proxy {}p)".format(self.current_video_path,
+                                                                int(video_data.playback_height)))
+        else:
+            self.status_bar.showMessage(osp.join(self.current_video_path))
         self.update_nav_clickers()
         self.playbackspeed_forward_btn.setEnabled(True)
         self.playbackspeed_backward_btn.setEnabled(True)
@@ -474,74 +763,318 @@ class ActionAnnotator(QWidget):
 
     def add_annotation(self):
         """ Adds new annotation to list and saves to disk """
+        from validate_annotations import MIN_COVERAGE  # deferred: pulls in pandas
 
         # log to csv
-        start_t = self.get_time_seconds(self.start_time.text())  # seconds
-        stop_t = self.get_time_seconds(self.stop_time.text())
         player_id = int(self.player_id.text())
-        vidname = self.current_video_name
-        frame_coords = self.frame_geometry
         action = self.classes_list[self.classes_qlist.currentRow()]
-        self.annotations_list.append(
-            [vidname, action, player_id, start_t, stop_t, self.start_frame.text(), self.stop_frame.text(),
-             frame_coords, self.mouse_x, self.mouse_y])
-
-        # save to disk
-        df = pd.DataFrame(self.annotations_list, columns=self.annotations_col_names)
-        df.to_csv(osp.join(self.annotations_dir, self.current_video_name.split('.')[0] + ".csv"), index=False)
-
-        # display
-        annot_str = ' '.join([str(elem) + ", " for elem in [action, player_id, start_t, stop_t]])
-        self.annotations_qlist.addItem(annot_str[:-2])
+        row = self.session.make_row(action, player_id, self.start_time.text(), self.stop_time.text(),
+                                    self.start_frame.text(), self.stop_frame.text(), self.frame_geometry,
+                                    self.mouse_x, self.mouse_y)
+
+        # also appends to `annotations_list`, and saves to disk (in the background)
+        duplicates, overlaps = self.session.add(row, self.annotations_model.append)
+        self.added_rows.append(row)
+        self.throughput.added()
+        self.update_throughput()
+        self.update_timeline()
+        self.update_annotation_count()
+
+        # select it
         self.annotations_qlist.setCurrentRow(self.annotations_qlist.count() - 1)
 
         self.reset_input()
 
+        # warn about annotations of the same player over the same frames (rows are numbered from 1), and about
+        # players not tracked on most of the annotated frames
+        warnings = []
+        if duplicates:
+            warnings.append("same action of player {} already annotated over these frames (row {})"
+                            .format(player_id, ', '.join(str(i + 1) for i in duplicates)))
+        elif overlaps:
+            warnings.append("overlaps other actions of player {} (row {})"
+                            .format(player_id, ', '.join(str(i + 1) for i in overlaps)))
+        coverage = row[TRACK_COVERAGE_COL]
+        if coverage < MIN_COVERAGE:
+            warnings.append("player {} tracked on {:.0%} of the frames".format(player_id, coverage))
+        if warnings:
+            self.status_bar.showMessage("WARNING: " + "; ".join(warnings))
+
     def delete_annotation(self):
         """ Deletes an annotation and saves to disk """
 
         # remove annotation
         index = self.annotations_qlist.currentRow()
-        self.annotations_qlist.takeItem(index)
-        self.annotations_list.pop(index)
+        if index < 0 or self.session is None:
+            return
 
-        # save to disk
-        df = pd.DataFrame(self.annotations_list, columns=self.annotations_col_names)
-        df.to_csv(osp.join(self.annotations_dir, self.current_video_name.split('.')[0] + ".csv"), index=False)
+        # also removes it from `annotations_list`, and saves to disk (in the background)
+        row = self.session.delete(index, self.annotations_model.pop)
+        self.added_rows = [added for added in self.added_rows if added is not row]
+        self.update_annotation_count()
+        self.update_timeline()
+
+    def undo_annotation(self):
+        """ Deletes the last annotation added to the current video """
+        if not self.added_rows or self.session is None:
+            return
+        row = self.added_rows.pop()
+        index = next(i for i in range(len(self.annotations_list) - 1, -1, -1) if self.annotations_list[i] is row)
+
+        # saved in the background, as when adding it
+        self.session.delete(index, self.annotations_model.pop)
+        self.update_annotation_count()
+        self.update_timeline()
+        self.throughput.undone()
+        self.update_throughput()
+        self.status_bar.showMessage("Undone: " + format_annotation(row))
+
+    def update_throughput(self):
+        """ Shows the number of annotations added this session and their rate in the status bar """
+        rate = self.throughput.per_minute()
+        self.throughput_label.setText('{} added{}'.format(
+            self.throughput.count, ', {:.1f}/min'.format(rate) if rate is not None else ''))
+
+    def compact_annotations(self):
+        """ Queues rewrite of the annotations csv of current video with all its logged edits """
+        if self.session is not None:
+            self.session.compact()
+
+    def update_write_status(self):
+        """ Shows number of annotation edits not saved yet and reports failed saves in the status bar """
+        pending = self.annotation_writer.pending_count
+        self.pending_writes_label.setText('pending writes: {}'.format(pending) if pending else '')
+        for error in self.annotation_writer.pop_errors():
+            self.status_bar.showMessage("ERROR: " + error)
+
+    def update_memory_status(self):
+        """ Shows resident memory and the memory held by the videos loaded in the prefetch cache """
+        rss = resident_memory()
+        text = 'memory: {:.0f} MB'.format(rss / 1024 ** 2) if rss is not None else ''
+        if self.video_loader is not None:
+            num_videos, nbytes = self.video_loader.usage()
+            text += '{}{} videos loaded ({:.0f} MB)'.format(', ' if text else '', num_videos, nbytes / 1024 ** 2)
+        self.memory_label.setText(text)
+
+    def update_profile_status(self):
+        """ Shows p50/p95 latencies of the slowest instrumented paths in the status bar """
+        self.profile_label.setText(profiler.summary_text())
+        self.profile_label.setToolTip('\n'.join(
+            '{}: p50 {:.1f} ms, p95 {:.1f} ms, max {:.1f} ms ({} calls)'.format(
+                name, stats['p50_ms'], stats['p95_ms'], stats['max_ms'], stats['count'])
+            for name, stats in profiler.summary().items()))
+
+    def session_state(self):
+        """ Returns the dataset, video, playback position and annotation being built, to be saved in the journal """
+        index = self.videos_qlist.currentRow()
+        return {
+            'root_dir': self.root_dir,
+            'video': self.videos_list[index] if self.videos_list and 0 <= index < len(self.videos_list) else None,
+            'position': self.resume_position if self.resume_position is not None else self.current_position(),
+            'frame': self.current_frame(),
+            'input': {'action': self.classes_qlist.currentRow(), 'start_time': self.start_time.text(),
+                      'stop_time': self.stop_time.text(), 'start_frame': self.start_frame.text(),
+                      'stop_frame': self.stop_frame.text(), 'player_id': self.player_id.text(),
+                      'mouse_x': self.mouse_x, 'mouse_y': self.mouse_y,
+                      'frame_geometry': list(self.frame_geometry) if self.frame_geometry is not None else None},
+        }
+
+    def save_session_state(self):
+        """ Hands the current state to the journal, which writes it on its own thread """
+        if self.journal is not None and self.root_dir:
+            self.journal.update(self.session_state())
+
+    def resume_session(self, state):
+        """Reopens the dataset and video of a saved session state, seeks to its position and restores the annotation
+        being built. Caches, the manifest and the frame server make this as fast as opening the video normally."""
+        root_dir = state.get('root_dir')
+        if not root_dir or not osp.isdir(root_dir):
+            return
+        self.open_root_dir(root_dir, state.get('video'))
+        if self.session is None or self.videos_list[self.videos_qlist.currentRow()] != state.get('video'):
+            return
+
+        # decode frames around the saved position right away, and seek there once the media is loaded
+        self.resume_position = int(state.get('position') or 0)
+        self.frame_server.set_position(int(state.get('frame') or 0))
+
+        saved = state.get('input') or {}
+        if 0 <= saved.get('action', -1) < len(self.classes_list):
+            self.classes_qlist.setCurrentRow(saved['action'])
+        for name in ('start_time', 'stop_time', 'start_frame', 'stop_frame', 'player_id'):
+            if saved.get(name):
+                getattr(self, name).setText(saved[name])
+        self.mouse_x, self.mouse_y = saved.get('mouse_x', 0), saved.get('mouse_y', 0)
+        if saved.get('frame_geometry') is not None:
+            self.frame_geometry = tuple(saved['frame_geometry'])
+        self.update_add_btn_status()
+        self.update_track_nav()
+        self.annotations_reset_btn.setEnabled(any(
+            saved.get(name, 'XX') not in ('XX', 'XX:XX') for name in ('start_time', 'stop_time', 'player_id')))
+        self.status_bar.showMessage("Resumed {} at {}".format(state['video'],
+                                                              self.get_time_string(self.resume_position)))
+
+    def shutdown(self):
+        """ Saves all pending annotation edits and the session state before the application exits """
+        if self.video_data is not None:
+            from prefetch import cancel_background_builds  # deferred: pulls in pandas and cv2
+
+            cancel_background_builds()  # exit does not wait for the probe or transcode of the opened video
+        if self.journal is not None:
+            self.save_session_state()
+            self.journal.close()
+        self.compact_annotations()
+        if not self.annotation_writer.shutdown():
+            for error in self.annotation_writer.pop_errors():
+                print("ERROR: " + error)
+            print("ERROR: some annotation edits could not be saved")
+
+    def update_timeline(self):
+        """ Re-indexes the frame intervals of current video's annotations and draws them on the timeline """
+        intervals = self.session.intervals
+        lanes, num_lanes = intervals.lanes()
+        colours = [self.action_colours.get(self.annotations_list[i][1], QColor(Qt.gray))
+                   for i in intervals.rows.tolist()]
+        self.timeline.set_intervals(self.num_frames, intervals.starts.tolist(), intervals.stops.tolist(),
+                                    lanes.tolist(), num_lanes, colours)
+
+    def seek_video_to_frame(self, frame_num):
+        """ Seeks video to `frame_num` (clicked on the timeline) and selects the first annotation containing it """
+        self.set_position(self.video_data.frame_index.position_of(frame_num))
+        rows = self.session.intervals.covering(frame_num)
+        if len(rows):
+            self.annotations_qlist.setCurrentRow(int(rows[0]))
 
     def seek_video_to_annotation(self):
         """ Seeks video to selected annotation """
+        from intervals import frame_number, START_FRAME_COL  # deferred: pulls in numpy
         idx = self.annotations_qlist.currentRow()
-        vidname, action, player_id, start_t, stop_t, start_f, stop_f, frame_coords, _, _ = self.annotations_list[idx]
-        self.set_position(start_t * 1000)  # converting to ms
+        row = self.annotations_list[idx]
+        start_f = frame_number(row[START_FRAME_COL])
+        if start_f < 0:  # rows saved without frames only have times
+            self.set_position(int(float(row[3]) * 1000))
+        else:
+            self.set_position(self.video_data.frame_index.position_of(start_f))
+
+    def step_frames(self, num_frames):
+        """Seeks video `num_frames` frames forward (backward if negative), landing on the start of that frame.
+
+        The frame is displayed straight from the frame server's buffer when it is there, and the media player is only
+        moved to it once stepping stops. Otherwise the media player seeks to it as usual.
+        """
+        frame_num = min(max(self.current_frame() + num_frames, 0), len(self.video_data.frame_index) - 1)
+        image = self.frame_server.get(frame_num) if self.frame_server is not None else None
+        if image is None:
+            self.set_position(self.video_data.frame_index.position_of(frame_num))
+            return
+
+        with profiler.span('step_frame'):
+            self.media_player.pause()
+            self.stepped_frame = frame_num
+            self.video_view.show_frame(image)
+            self.frame_server.set_position(frame_num)
+            self.position_changed(self.current_position())
+        self.media_sync_timer.start(300)
+
+    def update_overlay(self):
+        """ Draws tracking boxes of the frame currently displayed, if it changed since last call """
+        if self.tracking_annotations is None or not self.overlay_btn.isChecked():
+            return
+        frame_num = self.current_frame()
+        if frame_num != self.overlay_frame:
+            self.overlay_frame = frame_num
+            self.video_view.set_boxes(*self.tracking_annotations.boxes_at(frame_num))
+
+    def toggle_overlay(self, visible):
+        """ Callback for tracking boxes overlay toggle button """
+        self.video_view.set_overlay_visible(visible)
+        self.overlay_frame = None
+        self.update_overlay()
+
+    def sync_media_position(self):
+        """ Moves media player to the stepped frame, so that playback resumes from there """
+        if self.stepped_frame is not None:
+            self.media_player.setPosition(self.current_position())
+
+    def leave_frame_view(self):
+        """ Switches back from stepped frames to the media player's video output """
+        if self.stepped_frame is None:
+            return
+        self.media_sync_timer.stop()
+        self.sync_media_position()
+        self.stepped_frame = None
+        self.video_view.show_video()
+
+    def selected_player(self):
+        """ Returns id of the player selected by the last click, or None """
+        text = self.player_id.text()
+        return int(text) if text.lstrip('-').isdigit() and int(text) >= 0 else None
+
+    def update_track_nav(self):
+        """ Enables player track navigation when a player is selected, and redraws its gaps """
+        enabled = self.selected_player() is not None and self.tracking_annotations is not None
+        for btn in (self.track_first_btn, self.track_prev_btn, self.track_next_btn, self.track_gaps_btn):
+            btn.setEnabled(enabled)
+        self.update_track_gaps()
+
+    def update_track_gaps(self):
+        """ Marks the gaps of the selected player's track on the timeline, when the gaps button is checked """
+        player_id = self.selected_player()
+        if not self.track_gaps_btn.isChecked() or player_id is None or self.tracking_annotations is None:
+            self.timeline.set_marks([], [])
+            return
+        starts, stops = self.tracking_annotations.tracks.gaps(player_id)
+        self.timeline.set_marks(starts.tolist(), stops.tolist())
+        self.status_bar.showMessage("player {}: {} gaps, {} frames untracked".format(
+            player_id, len(starts), int((stops - starts + 1).sum())))
+
+    def seek_track_frame(self, frame_num, message):
+        """ Seeks video to `frame_num` of the selected player's track, or shows `message` if there is none """
+        if frame_num is None:
+            self.status_bar.showMessage(message)
+            return
+        self.set_position(self.video_data.frame_index.position_of(frame_num))
+
+    def seek_track_start(self):
+        """ Callback for first frame of the selected player's track button """
+        player_id = self.selected_player()
+        self.seek_track_frame(self.tracking_annotations.tracks.first_frame(player_id),
+                              "player {} is never tracked".format(player_id))
+
+    def seek_next_appearance(self):
+        """ Callback for next appearance of the selected player button """
+        player_id = self.selected_player()
+        self.seek_track_frame(self.tracking_annotations.tracks.next_appearance(player_id, self.current_frame()),
+                              "player {} does not appear again".format(player_id))
+
+    def seek_previous_appearance(self):
+        """ Callback for previous appearance of the selected player button """
+        player_id = self.selected_player()
+        self.seek_track_frame(self.tracking_annotations.tracks.previous_appearance(player_id, self.current_frame()),
+                              "player {} does not appear before".format(player_id))
 
     def next_frame(self):
         """ Callback for next frame button """
-        # curr_frame = int((self.mediaPlayer.position()/1000)*self.fps) #  miliseconds -> seconds -> frame
-        next_pos = self.media_player.position() + (1 / self.fps) * 1000
-        self.media_player.setPosition(next_pos)
+        self.step_frames(1)
 
     def nnext_frame(self):
         """ Callback for seek 5 frames button """
-        # curr_frame = int((self.mediaPlayer.position()/1000)*self.fps) #  miliseconds -> seconds -> frame
-        next_pos = self.media_player.position() + (5 / self.fps) * 1000
-        self.media_player.setPosition(next_pos)
+        self.step_frames(5)
 
     def prev_frame(self):
         """ Callback for previous frame button """
-        prev_pos = self.media_player.position() - (1 / self.fps) * 1000
-        self.media_player.setPosition(prev_pos)
+        self.step_frames(-1)
 
     def pprev_frame(self):
         """ Callback for seek to 5 previous frames button """
-        prev_pos = self.media_player.position() - (5 / self.fps) * 1000
-        self.media_player.setPosition(prev_pos)
+        self.step_frames(-5)
 
     def play(self):
         """ Toggles video playback """
         if self.media_player.state() == QMediaPlayer.PlayingState:
             self.media_player.pause()
         else:
+            self.leave_frame_view()
             self.media_player.play()
 
     def media_state_changed(self):
@@ -553,58 +1086,78 @@ class ActionAnnotator(QWidget):
             self.play_button.setIcon(
                 self.style().standardIcon(QStyle.SP_MediaPlay))
 
+            # buffer frames around the paused position, ready for frame stepping
+            if self.frame_server is not None:
+                self.frame_server.set_position(self.current_frame())
+
+    def media_status_changed(self, status):
+        if status in (QMediaPlayer.LoadedMedia, QMediaPlayer.BufferedMedia):
+            profiler.end('media_load')
+            if self.resume_position is not None:
+                self.media_player.pause()
+                self.set_position(self.resume_position)
+                self.resume_position = None
+
+    def media_position_changed(self, position):
+        """ Callback for position changes reported by the media player, which end pending seeks """
+        profiler.end('media_seek')
+        self.position_changed(position)
+
     def position_changed(self, position):
-        """ Updates playback time and frame number information """
+        """ Schedules update of everything showing the playback position """
+        self.position_updates.notify(position)
+
+    def update_playback_info(self, position):
+        """ Updates position slider, playback time and frame number information """
         self.position_slider.setValue(position)
-        duration = self.get_time_string(self.media_player.duration())
-        curr = self.get_time_string(self.media_player.position())
-        frame_num = int(self.fps * self.media_player.position() / 1000)
-        self.time_elapsed.setText(
-            self.playback_elapsed_string_format.format(curr, duration, frame_num, self.num_frames))
+        text = self.playback_elapsed_string_format.format(
+            self.get_time_string(self.current_position()), self.duration_string, self.current_frame(), self.num_frames)
+        if text != self.time_elapsed.text():
+            self.time_elapsed.setText(text)
 
     def duration_changed(self, duration):
         self.position_slider.setRange(0, duration)
-        duration = self.get_time_string(self.media_player.duration())
-        curr = self.get_time_string(self.media_player.position())
-        frame_num = int(self.fps * self.media_player.position() / 1000)
-        # self.time_elapsed.setText('{} / {}'.format(curr, duration))
-        self.time_elapsed.setText(
-            self.playback_elapsed_string_format.format(curr, duration, frame_num, self.num_frames))
-
-    @staticmethod
-    def get_time_string(time_ms):
-        """ converts `time_ms` (int) to mm:ss (string) format """
-        # minutes:seconds
-        time_seconds = int(time_ms / 1000)
-        mins = int(time_seconds / 60)
-        secs = time_seconds - mins * 60
-
-        return "{:02d}:{:02d}".format(mins, secs)
-
-    @staticmethod
-    def get_time_seconds(time_string):
-        """ converts "{:02d}:{:02d}" (string) to time in seconds (int) """
-        time_lst = [int(x) for x in time_string.split(":")]
-        bases = [60, 1]
-        return sum([time_lst[i] * bases[i] for i in range(len(time_lst))])
-
-    @staticmethod
-    def get_frame_number(position_milliseconds, fps):
-        frame_number = int((position_milliseconds / 1000) * fps)
-        return frame_number
+        self.duration_string = self.get_time_string(duration)
+        self.position_updates.invalidate()
+        self.position_changed(self.current_position())
 
+    get_time_string = staticmethod(get_time_string)
+    get_time_seconds = staticmethod(get_time_seconds)
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description='Action recognition annotation gui')
+    parser.add_argument('--startup-report', action='store_true',
+                        help='print startup phase and deferred import timings to stderr')
+    parser.add_argument('--profile', nargs='?', const='annotator_profile.json', metavar='PATH',
+                        help='time hot paths, show their latencies in the status bar and write a Chrome trace to PATH '
+                             'on exit (default: %(const)s)')
+    parser.add_argument('--hotkeys', default=DEFAULT_HOTKEYS_PATH, metavar='PATH',
+                        help='json file overriding the default keyboard shortcuts (default: %(default)s)')
+    parser.add_argument('--no-resume', action='store_true',
+                        help='start without reopening the dataset and video of the last session')
+    parser.add_argument('--proxy', nargs='?', type=int, const=720, metavar='HEIGHT',
+                        help='play videos higher than HEIGHT from low resolution proxies, transcoded in the background '
+                             'when missing (default: %(const)s)')
+    args, qt_args = parser.parse_known_args()
+    profiler.enabled = args.profile is not None
+    startup_report = StartupReport(args.startup_report)
+    startup_report.mark('gui modules imported')
+
+    app = QApplication(sys.argv[:1] + qt_args)
 
     # Action classes
     classes_list = ['shot', 'pass', 'advance', 'faceoff', 'forwards', 'backwards']
 
     main_window = QMainWindow()
 
-    annotator_widget = ActionAnnotator(classes_list)
+    # the last session is resumed once the window is shown
+    last_session = None if args.no_resume else load_session()
+    annotator_widget = ActionAnnotator(classes_list, proxy_height=args.proxy, journal=SessionJournal(),
+                                       hotkeys=load_hotkeys(args.hotkeys))
+    app.aboutToQuit.connect(annotator_widget.shutdown)
     annotator_widget.setWindowTitle("Action Annotation")
     annotator_widget.setWindowIcon(QtGui.QIcon('icon.png'))
+    startup_report.mark('widgets created')
 
     # Get screen geometry
     screen = app.primaryScreen()
@@ -615,5 +1168,20 @@ if __name__ == '__main__':
     main_window.setCentralWidget(annotator_widget)
     main_window.resize(width, height)  # 1200, 500
     main_window.show()
-
-    sys.exit(app.exec_())
+    startup_report.mark('window shown')
+
+    # heavy modules are only needed once a directory is opened: import them after the window is interactive
+    def on_event_loop_started():
+        startup_report.mark('event loop running')
+        if last_session is not None:
+            annotator_widget.resume_session(last_session)
+            startup_report.mark('session resumed')
+        import_deferred_modules(startup_report, on_done=startup_report.print_report)
+
+    QTimer.singleShot(0, on_event_loop_started)
+
+    exit_code = app.exec_()
+    if profiler.enabled:
+        profiler.dump(args.profile)
+        print("Profile written to {}".format(args.profile))
+    sys.exit(exit_code)
@@ -0,0 +1,275 @@
+"""Benchmarks of the annotation hot paths on synthetic datasets.
+
+Usage
+    python benchmark.py [--frames 1000 10000 50000] [--players 10 22] [--rows 100 1000 10000] [--quick]
+                        [--out report.json] [--compare baseline.json] [--keep DIR]
+
+Synthetic ``videos_tracked``/``annotations`` trees are generated in a temporary directory (or ``--keep DIR``): a short
+mp4 per video, a tracking file with ``players`` boxes on each of ``frames`` frames and an annotations csv with ``rows``
+rows. The non-GUI logic the annotator runs is timed on them, sweeping those sizes: tracking parsing and cached loading,
+player hit tests as in ``get_player_id``, annotation loading as in ``set_video``, adding and saving annotations as in
+``add_annotation``, log compaction and time conversions. No display or Qt is needed.
+
+The report is a JSON file holding the environment and, for each benchmark and size, statistics over its repeats. With
+``--compare`` the medians are printed next to those of an earlier report.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import os.path as osp
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from tracking import TrackingIndex, TrackIndex
+from frame_index import FrameIndex
+from prefetch import load_video_data
+from intervals import IntervalIndex
+from annotation_store import ANNOTATIONS_COL_NAMES, AnnotationLog, atomic_write_csv
+from validate_annotations import validate_rows
+from annotation_writer import AnnotationWriter
+from annotation_session import AnnotationSession
+from timecodes import get_time_string, get_time_seconds
+
+VIDEO_WIDTH, VIDEO_HEIGHT = 1280, 720  # pixel space of the tracking boxes
+VIDEO_FPS = 25
+MAX_VIDEO_FRAMES = 100  # the generated mp4 is only probed, keep it short
+ACTIONS = ['shot', 'pass', 'advance', 'faceoff', 'forwards', 'backwards']
+
+
+def make_video(path, num_frames, fps=VIDEO_FPS):
+    """Writes an mp4 of `num_frames` frames of a moving gradient.
+
+    It has the size of the tracking pixel space, as the annotator normalizes boxes by the probed video size.
+    """
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (VIDEO_WIDTH, VIDEO_HEIGHT))
+    ramp = np.tile((np.arange(VIDEO_WIDTH) * 256 // VIDEO_WIDTH).astype(np.uint8), (VIDEO_HEIGHT, 1))
+    for i in range(num_frames):
+        shift = np.uint8(i % 256)
+        writer.write(np.dstack([ramp + shift, ramp[:, ::-1] + shift * 2, np.full_like(ramp, shift)]))
+    writer.release()
+
+
+def make_tracking(path, num_frames, num_players, rng):
+    """ Writes a tracking file with `num_players` boxes per frame, drifting from random starting points """
+    frames = np.repeat(np.arange(1, num_frames + 1), num_players)
+    ids = np.tile(np.arange(num_players), num_frames)
+    w = np.tile(rng.uniform(20, 80, num_players), num_frames)
+    h = np.tile(rng.uniform(40, 160, num_players), num_frames)
+    drift = np.cumsum(rng.normal(0, 2, (num_frames, num_players, 2)), axis=0).reshape(-1, 2)
+    x = np.clip(np.tile(rng.uniform(0, VIDEO_WIDTH, num_players), num_frames) + drift[:, 0], 0, VIDEO_WIDTH - w)
+    y = np.clip(np.tile(rng.uniform(0, VIDEO_HEIGHT, num_players), num_frames) + drift[:, 1], 0, VIDEO_HEIGHT - h)
+    df = pd.DataFrame({'frame': frames, 'id': ids, 'x': x.round(2), 'y': y.round(2), 'w': w.round(2),
+                       'h': h.round(2), 'c': 1, 'a': -1, 'b': -1, 'd': -1})
+    df.to_csv(path, index=False)
+
+
+def make_annotation_rows(name, num_rows, num_frames, num_players, rng):
+    """ Returns `num_rows` random annotation rows of video `name`, not validated against tracking """
+    starts = rng.integers(1, num_frames, num_rows)
+    stops = np.minimum(starts + rng.integers(10, 200, num_rows), num_frames)
+    return [[name + '.mp4', ACTIONS[rng.integers(len(ACTIONS))], int(rng.integers(num_players)),
+             int(start // VIDEO_FPS), int(stop // VIDEO_FPS), int(start), int(stop),
+             '(0, 0, 1280, 720)', int(rng.integers(0, 1280)), int(rng.integers(0, 720))] + [float('nan')] * 3
+            for start, stop in zip(starts, stops)]
+
+
+def make_dataset(root_dir, name, num_frames, num_players, num_rows, seed=0):
+    """ Generates video `name` of a synthetic dataset in `root_dir`, returns its tracking and annotations paths """
+    rng = np.random.default_rng(seed)
+    video_dir = osp.join(root_dir, 'videos_tracked', name)
+    annotations_dir = osp.join(root_dir, 'annotations')
+    os.makedirs(video_dir, exist_ok=True)
+    os.makedirs(annotations_dir, exist_ok=True)
+
+    video_path = osp.join(video_dir, name + '.mp4')
+    make_video(video_path, min(num_frames, MAX_VIDEO_FRAMES))
+    FrameIndex.build_cache(video_path)  # as build_caches.py would, so loads do not probe it in the background
+    tracking_path = osp.join(video_dir, name + '.txt')
+    make_tracking(tracking_path, num_frames, num_players, rng)
+    csv_path = osp.join(annotations_dir, name + '.csv')
+    atomic_write_csv(csv_path, make_annotation_rows(name, num_rows, num_frames, num_players, rng),
+                     ANNOTATIONS_COL_NAMES)
+    return tracking_path, csv_path
+
+
+def measure(fn, repeats, number=1, setup=None):
+    """ Returns durations (s) of `repeats` runs of `number` calls to `fn`, per call; `setup` runs before each run """
+    durations = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        durations.append((time.perf_counter() - start) / number)
+    return durations
+
+
+def result(benchmark, params, durations):
+    durations = sorted(durations)
+    return {'benchmark': benchmark, 'params': params, 'repeats': len(durations),
+            'median_s': statistics.median(durations), 'min_s': durations[0],
+            'p95_s': durations[min(int(0.95 * len(durations)), len(durations) - 1)],
+            'mean_s': statistics.mean(durations)}
+
+
+def bench_tracking(root_dir, num_frames, num_players, repeats, rng):
+    """ Tracking file parsing, cached loading and per-click lookups """
+    name = 'tracking_{}x{}'.format(num_players, num_frames)
+    tracking_path, _ = make_dataset(root_dir, name, num_frames, num_players, 0)
+    params = {'frames': num_frames, 'players': num_players}
+
+    yield result('tracking_parse', params, measure(lambda: TrackingIndex.load(tracking_path, use_cache=False),
+                                                   max(repeats // 4, 3)))
+    TrackingIndex.load(tracking_path)  # builds the cache
+    yield result('tracking_load_cached', params, measure(lambda: TrackingIndex.load(tracking_path), repeats))
+
+    video_data = load_video_data(osp.join(root_dir, 'videos_tracked'), osp.join(root_dir, 'annotations'), name)
+    session = AnnotationSession(video_data, writer=None)
+    # clicks at the centre of a random player's box, as annotators click on players
+    queries = []
+    while len(queries) < 1000:
+        frame_num = int(rng.integers(1, num_frames + 1))
+        box = video_data.tracking_annotations.player_box(frame_num, int(rng.integers(num_players)))
+        if box is not None:
+            queries.append((frame_num, (box[0] + box[2] / 2.) / VIDEO_WIDTH, (box[1] + box[3] / 2.) / VIDEO_HEIGHT))
+    it = iter(queries * (repeats * 100 // len(queries) + 1))
+    yield result('hit_test', params, measure(lambda: session.player_at(*next(it)), repeats, number=100))
+    frames = iter(rng.integers(1, num_frames + 1, repeats * 100).tolist())
+    tracking = video_data.tracking_annotations
+    yield result('boxes_at', params, measure(lambda: tracking.boxes_at(next(frames)), repeats, number=100))
+
+    yield result('track_index_build', params, measure(
+        lambda: TrackIndex(tracking.frames, tracking.player_ids, tracking.boxes), max(repeats // 4, 3)))
+    tracks = tracking.tracks
+    steps = iter(zip(rng.integers(num_players, size=repeats * 100).tolist(),
+                     rng.integers(1, num_frames + 1, repeats * 100).tolist()))
+    yield result('track_next_appearance', params,
+                 measure(lambda: tracks.next_appearance(*next(steps)), repeats, number=100))
+
+
+def bench_annotations(root_dir, num_rows, repeats, rng):
+    """ Annotation loading, adding and saving, compaction, validation against tracking and interval queries """
+    name = 'annotations_{}'.format(num_rows)
+    _, csv_path = make_dataset(root_dir, name, 10000, 10, num_rows)
+    params = {'rows': num_rows}
+    videos_tracked_dir, annotations_dir = osp.join(root_dir, 'videos_tracked'), osp.join(root_dir, 'annotations')
+    log = AnnotationLog(csv_path)
+
+    yield result('annotations_load', params, measure(log.load, repeats))
+    yield result('load_video_data', params,
+                 measure(lambda: load_video_data(videos_tracked_dir, annotations_dir, name), repeats))
+
+    new_rows = make_annotation_rows(name, 50, 10000, 10, rng)
+    log.write_records([log.add_record(row) for row in new_rows])
+    yield result('annotations_load_with_log', dict(params, log_records=len(new_rows)), measure(log.load, repeats))
+    log.compact()
+
+    writer = AnnotationWriter(coalesce_delay=0)
+    session = AnnotationSession(load_video_data(videos_tracked_dir, annotations_dir, name), writer)
+    rows = iter(make_annotation_rows(name, repeats * 11, 10000, 10, rng))
+    yield result('annotation_add', params, measure(lambda: session.add(next(rows)), repeats, number=10))
+    yield result('annotation_save', params, measure(lambda: (session.add(next(rows)), writer.flush()), repeats))
+    writer.shutdown()
+
+    annotations_list, col_names = log.load()
+    yield result('annotations_compact', params,
+                 measure(lambda: log.compact(annotations_list, col_names), max(repeats // 4, 3)))
+    tracks = session.video_data.tracking_annotations.tracks
+    yield result('annotations_validate', params,
+                 measure(lambda: validate_rows(tracks, annotations_list), max(repeats // 4, 3)))
+
+    intervals = IntervalIndex.from_annotations(annotations_list)
+    frames = iter(rng.integers(1, 10000, repeats * 100).tolist())
+    yield result('intervals_build', params,
+                 measure(lambda: IntervalIndex.from_annotations(annotations_list), repeats))
+    yield result('intervals_covering', params,
+                 measure(lambda: intervals.covering(next(frames)), repeats, number=100))
+
+
+def bench_time_conversions(repeats, rng):
+    positions = iter(rng.integers(0, 3600 * 1000, repeats * 1000).tolist())
+    yield result('time_conversions', {},
+                 measure(lambda: get_time_seconds(get_time_string(next(positions))), repeats, number=1000))
+
+
+def environment():
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'numpy': np.__version__, 'pandas': pd.__version__, 'opencv': cv2.__version__,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def result_key(res):
+    return res['benchmark'], json.dumps(res['params'], sort_keys=True)
+
+
+def print_header():
+    print("  {:>12} | {:>12} | {:>7} | {}".format('median [us]', 'p95 [us]', 'vs base', 'benchmark'))
+
+
+def print_result(res, base=None):
+    ratio = '{:6.2f}x'.format(res['median_s'] / base['median_s']) if base and base['median_s'] else ''
+    print("  {:>12.1f} | {:>12.1f} | {:>7} | {} {}".format(
+        res['median_s'] * 1e6, res['p95_s'] * 1e6, ratio, res['benchmark'],
+        ' '.join('{}={}'.format(k, v) for k, v in res['params'].items())))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the annotation hot paths on synthetic datasets')
+    parser.add_argument('--frames', type=int, nargs='+', default=[1000, 10000, 50000],
+                        help='tracking file lengths to sweep')
+    parser.add_argument('--players', type=int, nargs='+', default=[10, 22], help='players per frame to sweep')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000, 10000],
+                        help='annotation csv sizes to sweep')
+    parser.add_argument('--repeats', type=int, default=20, help='runs of each benchmark')
+    parser.add_argument('--quick', action='store_true', help='smallest sizes and few repeats, as a smoke test')
+    parser.add_argument('--out', default='benchmark.json', help='report path')
+    parser.add_argument('--compare', help='earlier report to compare medians with')
+    parser.add_argument('--keep', help='generate datasets in this directory and keep them')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.frames, args.players, args.rows, args.repeats = [1000], [10], [100], 5
+
+    root_dir = args.keep or tempfile.mkdtemp(prefix='annotator_benchmark_')
+    rng = np.random.default_rng(args.seed)
+    results = []
+    try:
+        benchmarks = [bench_time_conversions(args.repeats, rng)]
+        benchmarks += [bench_tracking(root_dir, num_frames, num_players, args.repeats, rng)
+                       for num_frames in args.frames for num_players in args.players]
+        benchmarks += [bench_annotations(root_dir, num_rows, args.repeats, rng) for num_rows in args.rows]
+        print_header()
+        for benchmark in benchmarks:
+            for res in benchmark:
+                results.append(res)
+                print_result(res)
+    finally:
+        if not args.keep:
+            shutil.rmtree(root_dir, ignore_errors=True)
+
+    report = {'environment': environment(), 'args': vars(args), 'results': results}
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=1)
+    print("Report written to {}".format(args.out))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {result_key(res): res for res in json.load(f)['results']}
+        print("Compared with {}:".format(args.compare))
+        print_header()
+        for res in results:
+            print_result(res, baseline.get(result_key(res)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
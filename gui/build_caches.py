@@ -0,0 +1,78 @@
+"""Pre-builds binary caches (tracking data and frame timestamps) for every video of a dataset so the annotator loads
+them instantly.
+
+Usage
+    python build_caches.py <root_dir> [--force] [--no-frames] [--workers N]
+
+``root_dir`` is the same directory selected in the annotator, i.e. the one containing ``videos_tracked``.
+"""
+import os
+import sys
+import argparse
+import os.path as osp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from cache import is_cache_fresh
+from tracking import TrackingIndex, is_tracking_cache_fresh
+from frame_index import FrameIndex, frame_index_cache_path, FRAME_INDEX_CACHE_VERSION
+
+
+def list_video_dirs(videos_tracked_dir):
+    """ Lists `(name, folder)` of every video folder in `videos_tracked_dir` """
+    return [(name, osp.join(videos_tracked_dir, name)) for name in sorted(os.listdir(videos_tracked_dir))
+            if '.' not in name]
+
+
+def build_video_caches(name, video_dir, force=False, frames=True):
+    """ Builds caches of video `name` that are missing or stale, returns the list of caches (re)built """
+    built = []
+    tracking_txt_path = osp.join(video_dir, name + '.txt')
+    if osp.exists(tracking_txt_path) and (force or not is_tracking_cache_fresh(tracking_txt_path)):
+        TrackingIndex.build_cache(tracking_txt_path)
+        built.append('tracking')
+
+    video_path = osp.join(video_dir, name + '.mp4')
+    if frames and osp.exists(video_path) and (force or not is_cache_fresh(
+            frame_index_cache_path(video_path), video_path, FRAME_INDEX_CACHE_VERSION)):
+        FrameIndex.build_cache(video_path)
+        built.append('frames')
+    return built
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pre-build annotator caches for a videos_tracked tree')
+    parser.add_argument('root_dir', help='directory containing the videos_tracked folder')
+    parser.add_argument('--force', action='store_true', help='rebuild caches even if they are up to date')
+    parser.add_argument('--no-frames', action='store_true', help='skip frame timestamp indexes (slow to build)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    args = parser.parse_args(argv)
+
+    videos_tracked_dir = osp.join(args.root_dir, 'videos_tracked')
+    if not osp.isdir(videos_tracked_dir):
+        print("ERROR: {} does not exist".format(videos_tracked_dir))
+        return 1
+
+    video_dirs = list_video_dirs(videos_tracked_dir)
+    num_built = num_failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(build_video_caches, name, video_dir, args.force, not args.no_frames): video_dir
+                   for name, video_dir in video_dirs}
+        for i, future in enumerate(as_completed(futures)):
+            video_dir = futures[future]
+            try:
+                built = future.result()
+            except Exception as e:
+                num_failed += 1
+                print("[{}/{}] FAILED {}: {}".format(i + 1, len(video_dirs), video_dir, e))
+                continue
+            num_built += bool(built)
+            print("[{}/{}] {} {}".format(i + 1, len(video_dirs), 'built ' + ', '.join(built) if built else 'fresh',
+                                         video_dir))
+
+    print("Done: {} built, {} up to date, {} failed".format(
+        num_built, len(video_dirs) - num_built - num_failed, num_failed))
+    return 1 if num_failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
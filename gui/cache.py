@@ -0,0 +1,60 @@
+import os
+import json
+import os.path as osp
+
+import numpy as np
+
+
+def source_signature(source_path):
+    """ Returns the (mtime, size) signature used to detect stale caches of `source_path` """
+    st = os.stat(source_path)
+    return {'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+
+
+def meta_path(cache_path):
+    """ Returns path of the json file holding the signature of `cache_path` """
+    return cache_path + '.json'
+
+
+def is_cache_fresh(cache_path, source_path, version):
+    """ Checks that `cache_path` exists and was built from the current version of `source_path` """
+    try:
+        with open(meta_path(cache_path)) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    return (osp.exists(cache_path) and meta.get('version') == version and
+            meta.get('source') == source_signature(source_path))
+
+
+def load_cached_array(cache_path, source_path, version):
+    """ Memory maps the cached array of `source_path`, returns None if the cache is missing or stale """
+    if not is_cache_fresh(cache_path, source_path, version):
+        return None
+    try:
+        return np.load(cache_path, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+
+
+def save_cached_array(cache_path, signature, array, version):
+    """Writes `array` as the cache of the source file whose `source_signature` was `signature`.
+
+    The signature should be taken before the source is read, so that a source modified while being parsed is seen as
+    stale on the next load. Both files are written to a temporary name and renamed into place; the signature is written
+    last so that an interrupted write is also seen as a stale cache.
+    """
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, cache_path)
+    save_cache_meta(cache_path, signature, version)
+
+
+def save_cache_meta(cache_path, signature, version):
+    """ Marks `cache_path`, already written in place, as built from the source whose signature was `signature` """
+    tmp_meta_path = meta_path(cache_path) + '.tmp'
+    with open(tmp_meta_path, 'w') as f:
+        json.dump({'version': version, 'source': signature}, f)
+    os.replace(tmp_meta_path, meta_path(cache_path))
@@ -0,0 +1,204 @@
+"""Statistics, train/val/test splits and a consolidated export of the annotations of a whole dataset.
+
+Usage
+    python dataset_report.py <root_dir> <out_dir> [--format parquet|feather|csv] [--splits 0.8 0.1 0.1] [--seed 0]
+                             [--workers N]
+
+Every csv in ``<root_dir>/annotations`` (including edits still in its log) is read in parallel, or the annotations
+database if the dataset has one, with the fixed column types of ``ANNOTATIONS_DTYPES``. Videos are assigned whole to
+the train, val and test splits, so that no frame of a video used for training ends up in another split, greedily
+keeping the per-action counts of each split close to its share. The output directory receives
+
+    annotations.<format>  every annotation with its video, split, length in frames and duration
+    splits.csv            the split of every video
+    summary.json          action histogram per split, annotations per player and interval lengths per action
+
+and the summary is printed. Parquet and Feather need pyarrow.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import os.path as osp
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from annotation_store import ANNOTATIONS_COL_NAMES, ANNOTATIONS_DTYPES, AnnotationLog, list_annotation_files
+from annotation_db import AnnotationDB, db_path
+from validate_annotations import MIN_COVERAGE
+
+SPLIT_NAMES = ['train', 'val', 'test']
+FORMATS = {'parquet': '.parquet', 'feather': '.feather', 'csv': '.csv'}
+
+
+def read_video_annotations(name, csv_path):
+    """ Returns the annotations of video `name` as a DataFrame with `ANNOTATIONS_DTYPES` and a ``video`` column """
+    log = AnnotationLog(csv_path)
+    if osp.exists(log.log_path):
+        annotations_list, annotations_col_names = log.load()
+        df = pd.DataFrame(annotations_list, columns=annotations_col_names)
+    else:
+        df = pd.read_csv(csv_path, dtype=ANNOTATIONS_DTYPES)  # no pending edits: parse the csv directly
+    df = to_fixed_dtypes(df)
+    df.insert(0, 'video', name)
+    return df
+
+
+def read_videos(csv_paths):
+    """ Reads the annotations of the videos of `csv_paths` into one DataFrame (one chunk of a parallel read) """
+    return pd.concat([read_video_annotations(osp.splitext(osp.basename(path))[0], path) for path in csv_paths],
+                     ignore_index=True)
+
+
+def to_fixed_dtypes(df):
+    """ Returns `df` with the columns of `ANNOTATIONS_COL_NAMES` (added if missing) cast to `ANNOTATIONS_DTYPES` """
+    return df.reindex(columns=ANNOTATIONS_COL_NAMES).astype(ANNOTATIONS_DTYPES)
+
+
+def read_annotations(root_dir, workers=None):
+    """Returns the annotations of every video of the dataset in `root_dir` as one DataFrame.
+
+    Csv files are read in parallel by `workers` processes, each reading a chunk of files to amortize transfers.
+    """
+    if osp.exists(db_path(root_dir)):
+        df = AnnotationDB(db_path(root_dir)).query()
+        video = df.pop('video')
+        df = to_fixed_dtypes(df)
+        df.insert(0, 'video', video)
+        return df
+
+    csv_paths = list_annotation_files(osp.join(root_dir, 'annotations'))
+    if not csv_paths:
+        df = to_fixed_dtypes(pd.DataFrame())
+        df.insert(0, 'video', pd.Series(dtype='object'))
+        return df
+    workers = max(min(workers or os.cpu_count() or 1, len(csv_paths)), 1)
+    chunks = [chunk.tolist() for chunk in np.array_split(np.array(csv_paths, dtype=object),
+                                                         min(workers * 4, len(csv_paths)))]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return pd.concat(list(executor.map(read_videos, chunks)), ignore_index=True)
+
+
+def add_intervals(df):
+    """ Adds the length in frames and duration in seconds of every annotation """
+    return df.assign(num_frames=(df['stop_frame'] - df['start_frame'] + 1).clip(lower=1),
+                     duration_s=(df['stop_time_s'] - df['start_time_s']).clip(lower=0))
+
+
+def split_videos(df, fractions, seed=0):
+    """Assigns every video to one of `SPLIT_NAMES`, returns the split of each video as a Series.
+
+    Videos are taken from the most to the least annotated (ties in random order, from `seed`), each going to the
+    split that brings the per-action counts of the splits closest to ``fractions`` of the totals: adding counts ``v``
+    to split ``s`` changes its squared distance to its targets by ``2 v.(counts_s - targets_s) + |v|^2``.
+    """
+    counts = pd.crosstab(df['video'], df['action'])
+    videos, v = counts.index, counts.to_numpy(dtype=np.float64)
+    fractions = np.asarray(fractions, dtype=np.float64) / np.sum(fractions)
+    targets = np.outer(fractions, v.sum(axis=0))
+    assigned = np.zeros_like(targets)
+
+    rng = np.random.default_rng(seed)
+    splits = np.empty(len(videos), dtype=np.int64)
+    for i in np.lexsort((rng.random(len(videos)), -v.sum(axis=1))):
+        s = int(np.argmin((assigned - targets) @ v[i]))
+        assigned[s] += v[i]
+        splits[i] = s
+    return pd.Series(np.asarray(SPLIT_NAMES)[splits], index=videos, name='split')
+
+
+def json_number(value):
+    """ Returns `value` as a float, or None if it is missing (NaN or NA), which json has no number for """
+    return None if pd.isna(value) else float(value)
+
+
+def summarize(df):
+    """ Returns the statistics of annotations `df` (with intervals and splits) as a json serializable dict """
+    by_split = df.groupby('split', observed=True)
+    histogram = pd.crosstab(df['action'], df['split']).reindex(columns=SPLIT_NAMES, fill_value=0)
+    players = df.groupby(['video', 'player_id'], observed=True).size()
+    lengths = df['num_frames'].astype('float64').groupby(df['action'], observed=True).describe(
+        percentiles=[.05, .5, .95])
+    return {
+        'num_annotations': int(len(df)),
+        'num_videos': int(df['video'].nunique()),
+        'splits': {split: {'videos': int(by_split['video'].nunique().get(split, 0)),
+                           'annotations': int(by_split.size().get(split, 0))} for split in SPLIT_NAMES},
+        'actions': {action: {split: int(n) for split, n in row.items()} for action, row in histogram.iterrows()},
+        'players': {'num_players': int(len(players)),
+                    'annotations_per_player': {k: json_number(v) for k, v in players.describe().items()}},
+        'num_frames': {action: {k: json_number(v) for k, v in row.items()} for action, row in lengths.iterrows()},
+        'low_coverage': int((df['track_coverage'] < MIN_COVERAGE).sum()),
+    }
+
+
+def format_summary(summary):
+    lines = ["{} annotations of {} videos".format(summary['num_annotations'], summary['num_videos'])]
+    lines.extend("  {:>5}: {} videos, {} annotations".format(split, s['videos'], s['annotations'])
+                 for split, s in summary['splits'].items())
+    lines.append("  {:>12} | {}".format('action', ' | '.join('{:>7}'.format(split) for split in SPLIT_NAMES)) +
+                 " | frames (median, p95)")
+    for action, counts in summary['actions'].items():
+        frames = summary['num_frames'].get(action, {})
+        lines.append("  {:>12} | {} | {:.0f}, {:.0f}".format(
+            action, ' | '.join('{:>7d}'.format(counts[split]) for split in SPLIT_NAMES),
+            frames.get('50%') or float('nan'), frames.get('95%') or float('nan')))
+    per_player = summary['players']['annotations_per_player']
+    lines.append("{} players, {:.1f} annotations per player on average (max {:.0f})".format(
+        summary['players']['num_players'], per_player.get('mean') or 0, per_player.get('max') or 0))
+    lines.append("{} annotations with track coverage below {:.0%}".format(summary['low_coverage'], MIN_COVERAGE))
+    return '\n'.join(lines)
+
+
+def write_table(df, path, fmt):
+    if fmt == 'parquet':
+        df.to_parquet(path, index=False)
+    elif fmt == 'feather':
+        df.to_feather(path)
+    else:
+        df.to_csv(path, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Summarize, split and export the annotations of a dataset')
+    parser.add_argument('root_dir', help='directory containing the annotations folder')
+    parser.add_argument('out_dir', help='directory the report and tables are written to')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='parquet', help='format of the annotations table')
+    parser.add_argument('--splits', type=float, nargs=3, default=[0.8, 0.1, 0.1], metavar=('TRAIN', 'VAL', 'TEST'),
+                        help='share of the annotations of each split')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the order of equally annotated videos')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    args = parser.parse_args(argv)
+
+    start_time = time.time()
+    df = read_annotations(args.root_dir, args.workers)
+    print("Read {} annotations in {:.1f}s".format(len(df), time.time() - start_time))
+
+    splits = split_videos(df, args.splits, args.seed)
+    df = add_intervals(df)
+    df.insert(1, 'split', df['video'].map(splits))
+    for col in ('video', 'split', 'action'):
+        df[col] = df[col].astype('category')
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    table_path = osp.join(args.out_dir, 'annotations' + FORMATS[args.format])
+    try:
+        write_table(df, table_path, args.format)
+    except ImportError:
+        print("ERROR: writing {} requires pyarrow (pip install pyarrow)".format(args.format))
+        return 1
+    splits.rename_axis('video').to_csv(osp.join(args.out_dir, 'splits.csv'))
+
+    summary = summarize(df)
+    with open(osp.join(args.out_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(format_summary(summary))
+    print("Written to {} ({:.1f}s)".format(args.out_dir, time.time() - start_time))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""Exports player-centred training clips of every annotated action.
+
+Usage
+    python export_clips.py <root_dir> <out_dir> [--size 112] [--context 1.5] [--workers N] [--force]
+
+Every csv in ``<root_dir>/annotations`` is read (including edits still in its log), or the annotations database if
+the dataset has one. Each video is decoded once, sequentially, and every annotated action is saved as a
+``(num_frames, size, size, 3)`` uint8 BGR stack of square crops centred on the annotated player's tracking box:
+
+    <out_dir>/<video>/<index>_<action>_<player_id>.npy
+
+along with ``<out_dir>/<video>/clips.csv`` describing the clips. Videos are processed in parallel, one per worker.
+A finished video is marked with ``_done.json`` holding the signature of its annotations, so re-running the
+command resumes where it stopped and only re-exports videos whose annotations changed.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import os.path as osp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from tracking import TrackingIndex
+from intervals import frame_number
+from annotation_store import AnnotationLog, file_signature, list_annotation_files, LOG_SUFFIX
+from annotation_db import AnnotationDB, db_path
+
+DONE_FILE = '_done.json'
+MAX_SKIP_FRAMES = 300  # gaps between actions longer than this are seeked over instead of decoded
+
+
+def annotation_signature(name, csv_path, db_file):
+    """ Identifies the current annotations of video `name`: its csv and pending log, or its rows in the database """
+    if db_file is not None:
+        return AnnotationDB(db_file).signature(name)
+    return '{}|{}'.format(file_signature(csv_path), file_signature(csv_path + LOG_SUFFIX))
+
+
+def is_exported(video_out_dir, signature):
+    """ Checks whether the clips of a video were fully exported from annotations with `signature` """
+    try:
+        with open(osp.join(video_out_dir, DONE_FILE)) as f:
+            return json.load(f).get('annotations') == signature
+    except (OSError, ValueError):
+        return False
+
+
+def crop_around_box(frame, box, size, context):
+    """ Returns a `size` x `size` square crop of `frame` centred on `box` (x1, y1, w, h), zero padded at borders """
+    x1, y1, w, h = box
+    side = max(int(round(max(w, h) * context)), 2)
+    cx, cy = int(round(x1 + w / 2.)), int(round(y1 + h / 2.))
+    left, top = cx - side // 2, cy - side // 2
+
+    crop = np.zeros((side, side, 3), dtype=np.uint8)
+    fx1, fy1 = max(left, 0), max(top, 0)
+    fx2, fy2 = min(left + side, frame.shape[1]), min(top + side, frame.shape[0])
+    if fx1 < fx2 and fy1 < fy2:
+        crop[fy1 - top:fy2 - top, fx1 - left:fx2 - left] = frame[fy1:fy2, fx1:fx2]
+    return cv2.resize(crop, (size, size), interpolation=cv2.INTER_AREA)
+
+
+def remove_stale_clips(video_out_dir, files):
+    """ Unmarks `video_out_dir` as exported and deletes its clips that are not in `files`, left by an earlier export """
+    done_path = osp.join(video_out_dir, DONE_FILE)
+    if osp.exists(done_path):
+        os.remove(done_path)
+    for entry in os.listdir(video_out_dir):
+        if entry.endswith(('.npy', '.npy.tmp')) and entry not in files:
+            os.remove(osp.join(video_out_dir, entry))
+
+
+def export_video(name, csv_path, db_file, videos_tracked_dir, out_dir, size, context):
+    """Exports the clips of every annotation of video `name`.
+
+    Returns the number of clips written and (index, action, player_id) of the annotations skipped for lack of frames.
+    """
+    signature = annotation_signature(name, csv_path, db_file)
+    if db_file is not None:
+        annotations_list, annotations_col_names = AnnotationDB(db_file).load(name)
+    else:
+        annotations_list, annotations_col_names = AnnotationLog(csv_path).load()
+    df = pd.DataFrame(annotations_list, columns=annotations_col_names)
+    tracking = TrackingIndex.load(osp.join(videos_tracked_dir, name, name + '.txt'))
+
+    video_out_dir = osp.join(out_dir, name)
+    os.makedirs(video_out_dir, exist_ok=True)
+
+    clips, skipped = [], []
+    for index, row in enumerate(df.itertuples(index=False)):
+        start_frame, stop_frame = frame_number(row.start_frame), frame_number(row.stop_frame)
+        if start_frame < 0:
+            skipped.append((index, row.action, row.player_id))
+            continue
+        clips.append({'index': index, 'action': row.action, 'player_id': int(row.player_id),
+                      'start_frame': start_frame, 'stop_frame': max(stop_frame, start_frame),
+                      'file': '{:05d}_{}_{}.npy'.format(index, row.action, int(row.player_id))})
+
+    remove_stale_clips(video_out_dir, {clip['file'] for clip in clips})
+    if clips:
+        decode_clips(osp.join(videos_tracked_dir, name, name + '.mp4'), clips, tracking, size, context,
+                     video_out_dir)
+
+    pd.DataFrame(clips, columns=['index', 'action', 'player_id', 'start_frame', 'stop_frame', 'file', 'coverage']
+                 ).to_csv(osp.join(video_out_dir, 'clips.csv'), index=False)
+    with open(osp.join(video_out_dir, DONE_FILE), 'w') as f:
+        json.dump({'annotations': signature, 'num_clips': len(clips)}, f)
+    return len(clips), skipped
+
+
+def start_clip(clip, size):
+    """ Allocates the frames of `clip` when decoding reaches its first frame """
+    clip['frames'] = np.zeros((clip['stop_frame'] - clip['start_frame'] + 1, size, size, 3), dtype=np.uint8)
+    clip['last_box'] = None
+    clip['tracked_frames'] = 0
+
+
+def save_clip(clip, video_out_dir):
+    """ Writes the frames of a finished `clip` and releases them """
+    tmp_path = osp.join(video_out_dir, clip['file'] + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        np.save(f, clip.pop('frames'))
+    os.replace(tmp_path, osp.join(video_out_dir, clip['file']))
+    clip['coverage'] = clip.pop('tracked_frames') / float(clip['stop_frame'] - clip['start_frame'] + 1)
+    del clip['last_box']
+
+
+def decode_clips(video_path, clips, tracking, size, context, video_out_dir):
+    """Decodes `video_path` once, from the first to the last annotated frame, writing every clip as soon as it ends.
+
+    Only the frames of clips overlapping the current frame are held in memory. Frames where the player is not tracked
+    reuse the player's last known box (or stay black before the first one).
+    """
+    pending = sorted(clips, key=lambda clip: clip['start_frame'])
+    last = max(clip['stop_frame'] for clip in clips)
+
+    cap = cv2.VideoCapture(video_path)
+    frame_num = pending[0]['start_frame']
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+    next_clip = 0
+    active = []
+    while frame_num <= last:
+        while next_clip < len(pending) and pending[next_clip]['start_frame'] <= frame_num:
+            start_clip(pending[next_clip], size)
+            active.append(pending[next_clip])
+            next_clip += 1
+
+        if not active:
+            # nothing to crop until the next clip starts: skip undecoded frames, or seek over long gaps
+            target = pending[next_clip]['start_frame']
+            if target - frame_num > MAX_SKIP_FRAMES:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+            else:
+                for _ in range(target - frame_num):
+                    cap.grab()
+            frame_num = target
+            continue
+
+        ok, frame = cap.read()
+        if not ok:
+            break
+        for clip in active:
+            box = tracking.player_box(frame_num, clip['player_id'])
+            if box is not None:
+                clip['last_box'] = box
+                clip['tracked_frames'] += 1
+            if clip['last_box'] is not None:
+                clip['frames'][frame_num - clip['start_frame']] = crop_around_box(
+                    frame, clip['last_box'], size, context)
+
+        for clip in [clip for clip in active if clip['stop_frame'] == frame_num]:
+            save_clip(clip, video_out_dir)
+            active.remove(clip)
+        frame_num += 1
+    cap.release()
+
+    # clips running past the end of the video, or never reached, are saved with black frames
+    for clip in pending:
+        if 'frames' not in clip and 'coverage' not in clip:
+            start_clip(clip, size)
+        if 'frames' in clip:
+            save_clip(clip, video_out_dir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export player-centred clips of every annotated action')
+    parser.add_argument('root_dir', help='directory containing the videos_tracked and annotations folders')
+    parser.add_argument('out_dir', help='directory clips are written to')
+    parser.add_argument('--size', type=int, default=112, help='side of the square crops, in pixels')
+    parser.add_argument('--context', type=float, default=1.5, help='crop side relative to the longest box side')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--force', action='store_true', help='re-export videos that were already exported')
+    args = parser.parse_args(argv)
+
+    videos_tracked_dir = osp.join(args.root_dir, 'videos_tracked')
+    db_file = db_path(args.root_dir) if osp.exists(db_path(args.root_dir)) else None
+    if db_file is not None:
+        videos = [(name, None) for name in AnnotationDB(db_file).videos()]
+    else:
+        videos = [(osp.splitext(osp.basename(path))[0], path)
+                  for path in list_annotation_files(osp.join(args.root_dir, 'annotations'))]
+    todo = videos
+    if not args.force:
+        todo = [(name, path) for name, path in videos
+                if not is_exported(osp.join(args.out_dir, name), annotation_signature(name, path, db_file))]
+    print("{} annotated videos, {} to export".format(len(videos), len(todo)))
+
+    num_failed = num_clips = num_skipped = 0
+    start_time = time.time()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(export_video, name, path, db_file, videos_tracked_dir, args.out_dir, args.size,
+                                   args.context): name for name, path in todo}
+        for i, future in enumerate(as_completed(futures)):
+            name = futures[future]
+            try:
+                n, skipped = future.result()
+            except Exception as e:
+                num_failed += 1
+                print("[{}/{}] FAILED {}: {}".format(i + 1, len(todo), name, e))
+                continue
+            num_clips += n
+            num_skipped += len(skipped)
+            print("[{}/{}] {}: {} clips, {} skipped ({:.0f}s elapsed)".format(
+                i + 1, len(todo), name, n, len(skipped), time.time() - start_time))
+            for index, action, player_id in skipped:
+                print("    #{} {} player {}: no start frame".format(index, action, player_id))
+
+    print("Done: {} clips exported, {} annotations without frames skipped, {} videos failed".format(
+        num_clips, num_skipped, num_failed))
+    return 1 if num_failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
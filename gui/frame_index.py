@@ -0,0 +1,119 @@
+import math
+import os.path as osp
+import threading
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+import cv2
+import numpy as np
+
+from cache import source_signature, load_cached_array, save_cached_array
+
+FRAME_INDEX_CACHE_VERSION = 1
+FRAME_INDEX_CACHE_SUFFIX = '.frames.npy'
+
+_build_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='frame-index')
+_build_futures = {}
+_build_cancel_events = {}  # video path -> event stopping its running build
+_build_futures_lock = threading.Lock()
+
+
+def frame_index_cache_path(video_path):
+    """ Returns path of the frame timestamps cache sitting next to `video_path` """
+    return osp.splitext(video_path)[0] + FRAME_INDEX_CACHE_SUFFIX
+
+
+class FrameIndex(object):
+    """Presentation timestamp (ms) of every frame of a video.
+
+    Maps playback positions to frame numbers and back with binary searches, so frame stepping lands on exact frames
+    and the frame used for tracking lookups is the one on screen, including on variable frame rate videos. Frame ``i``
+    is displayed from ``timestamps[i]`` until ``timestamps[i + 1]``.
+    """
+
+    def __init__(self, timestamps, exact=True):
+        self.timestamps = timestamps
+        self.exact = exact  # False when timestamps are estimated from the nominal frame rate
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @classmethod
+    def constant_rate(cls, num_frames, fps):
+        """ Estimates timestamps from the nominal frame rate, as used until the probed index is available """
+        return cls(np.arange(max(num_frames, 1)) * (1000. / fps), exact=False)
+
+    @classmethod
+    def probe(cls, video_path, cancelled=None):
+        """Reads timestamps of every frame of `video_path`.
+
+        This decodes the whole video (``grab`` only skips the conversion of frames to BGR), so it is as slow as
+        playing it. It raises `CancelledError` as soon as event `cancelled` is set.
+        """
+        cap = cv2.VideoCapture(video_path)
+        timestamps = []
+        while cap.grab():
+            if cancelled is not None and cancelled.is_set():
+                cap.release()
+                raise CancelledError("Probing {} was cancelled".format(video_path))
+            timestamps.append(cap.get(cv2.CAP_PROP_POS_MSEC))
+        cap.release()
+        if not timestamps:
+            raise IOError("Could not read frames of {}".format(video_path))
+
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        timestamps -= timestamps[0]  # playback positions start at 0
+        return cls(np.maximum.accumulate(timestamps))
+
+    @classmethod
+    def load_cached(cls, video_path):
+        """ Returns the cached index of `video_path`, or None if it was not built yet or is stale """
+        timestamps = load_cached_array(frame_index_cache_path(video_path), video_path, FRAME_INDEX_CACHE_VERSION)
+        return None if timestamps is None else cls(timestamps)
+
+    @classmethod
+    def build_cache(cls, video_path, cancelled=None):
+        """ Probes `video_path`, caches its timestamps and returns the resulting index """
+        signature = source_signature(video_path)
+        index = cls.probe(video_path, cancelled)
+        try:
+            save_cached_array(frame_index_cache_path(video_path), signature, index.timestamps,
+                              FRAME_INDEX_CACHE_VERSION)
+        except OSError as e:
+            print("Could not write frame index cache for {}: {}".format(video_path, e))
+        return index
+
+    @classmethod
+    def build_in_background(cls, video_path):
+        """Starts building the cache of `video_path` on the frame index thread, returns a future of the index.
+
+        Only the opened video should be probed: `cancel_builds` stops builds of videos the user navigated away from.
+        """
+        with _build_futures_lock:
+            future = _build_futures.get(video_path)
+            if future is None or future.done():
+                cancelled = _build_cancel_events[video_path] = threading.Event()
+                future = _build_futures[video_path] = _build_executor.submit(cls.build_cache, video_path, cancelled)
+            return future
+
+    def frame_at(self, position_ms):
+        """ Returns number of the frame displayed at playback position `position_ms` """
+        i = int(np.searchsorted(self.timestamps, position_ms, side='right')) - 1
+        return min(max(i, 0), len(self.timestamps) - 1)
+
+    def position_of(self, frame_num):
+        """ Returns first playback position (integer ms) at which `frame_num` is displayed """
+        frame_num = min(max(int(frame_num), 0), len(self.timestamps) - 1)
+        return int(math.ceil(self.timestamps[frame_num]))
+
+    def step(self, position_ms, num_frames):
+        """ Returns position of the frame `num_frames` frames away from the one displayed at `position_ms` """
+        return self.position_of(self.frame_at(position_ms) + num_frames)
+
+
+def cancel_builds(keep=None):
+    """ Cancels the background builds of every video but `keep`: queued ones are dropped and the running one stops """
+    with _build_futures_lock:
+        for video_path, future in _build_futures.items():
+            if video_path != keep and not future.done():
+                future.cancel()
+                _build_cancel_events[video_path].set()
@@ -0,0 +1,101 @@
+import threading
+
+import cv2
+import numpy as np
+
+from profiling import profiler
+
+
+class FrameServer(object):
+    """Decodes a window of frames around the current frame into a ring buffer, on a background thread.
+
+    Frame ``i`` is stored in slot ``i % capacity`` of a preallocated ``(capacity, height, width, 3)`` array. The window
+    spans ``behind`` frames before the current frame and the rest of the capacity after it. Moving the current frame
+    with ``set_position`` only decodes the frames of the new window that are not already buffered, so stepping back and
+    forth inside the window does not decode anything.
+    """
+
+    def __init__(self, video_path, vid_width, vid_height, num_frames, max_bytes=256 * 1024 ** 2, max_capacity=64,
+                 behind=16):
+        frame_bytes = int(vid_width) * int(vid_height) * 3
+        self.capacity = int(min(max(max_bytes // max(frame_bytes, 1), 8), max_capacity))
+        self.behind = min(behind, self.capacity // 4)
+        self.num_frames = num_frames
+        self.video_path = video_path
+
+        self.buffer = np.zeros((self.capacity, int(vid_height), int(vid_width), 3), dtype=np.uint8)
+        self.slot_frames = np.full(self.capacity, -1, dtype=np.int64)  # frame held by each slot, -1 if none
+
+        self._center = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._worker = threading.Thread(target=self._run, name='frame-server', daemon=True)
+        self._worker.start()
+
+    def window(self):
+        """ Returns [first, last) frame numbers of the current window """
+        first = max(self._center - self.behind, 0)
+        return first, min(first + self.capacity, self.num_frames)
+
+    def get(self, frame_num):
+        """ Returns a copy of decoded frame `frame_num` (BGR), or None if it is not buffered """
+        with self._cond:
+            slot = frame_num % self.capacity
+            if self.slot_frames[slot] != frame_num:
+                return None
+            return self.buffer[slot].copy()
+
+    def set_position(self, frame_num):
+        """ Moves the window around `frame_num` """
+        with self._cond:
+            self._center = int(frame_num)
+            self._cond.notify_all()
+
+    def close(self):
+        """ Stops the decoding thread """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _next_missing(self):
+        """ Returns first frame of the window that is not buffered, or None if the window is complete """
+        first, last = self.window()
+        frames = np.arange(first, last)
+        missing = frames[self.slot_frames[frames % self.capacity] != frames]
+        return int(missing[0]) if len(missing) else None
+
+    def _run(self):
+        cap = cv2.VideoCapture(self.video_path)
+        next_decoded = 0  # frame returned by the next cap.read()
+        scratch = None
+
+        while True:
+            with self._cond:
+                frame_num = self._next_missing()
+                while frame_num is None and not self._closed:
+                    self._cond.wait()
+                    frame_num = self._next_missing()
+                if self._closed:
+                    break
+
+            if frame_num != next_decoded:
+                with profiler.span('frame_seek'):
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+            with profiler.span('frame_decode'):
+                ok, scratch = cap.read(scratch)
+            next_decoded = frame_num + 1
+            if not ok:
+                # past the real end of the video: stop asking for frames that do not exist
+                with self._cond:
+                    self.num_frames = min(self.num_frames, frame_num)
+                continue
+
+            with self._cond:
+                slot = frame_num % self.capacity
+                if scratch.shape == self.buffer.shape[1:]:
+                    self.buffer[slot] = scratch
+                else:
+                    self.buffer[slot] = cv2.resize(scratch, self.buffer.shape[2:0:-1])
+                self.slot_frames[slot] = frame_num
+
+        cap.release()
@@ -0,0 +1,83 @@
+"""Keyboard shortcuts of the annotator.
+
+Every command has a list of keys, written as Qt key sequences ('Space', 'Shift+D', 'Ctrl+Z', ...). The defaults below
+can be overridden by a json file mapping command names to a key or a list of keys, ``~/.action_annotator/hotkeys.json``
+by default, e.g. ``{"commit": ["C", "Ctrl+Return"], "set_start": "1"}``. The i-th key of ``select_class`` selects the
+i-th action class. Keys given in the file take precedence: a default key also bound by the file only runs the file's
+command, so in the example ``1`` sets the start time instead of selecting the first class.
+"""
+import json
+import os.path as osp
+
+from session_journal import CONFIG_DIR
+
+DEFAULT_HOTKEYS_PATH = osp.join(CONFIG_DIR, 'hotkeys.json')
+
+DEFAULT_HOTKEYS = {
+    'play': ['Space', 'Return', 'Enter'],
+    'seek_forward': ['Right'],  # +500 ms
+    'seek_backward': ['Left'],
+    'next_frame': ['D', '.'],
+    'prev_frame': ['A', ','],
+    'nnext_frame': ['Shift+D'],  # 5 frames
+    'pprev_frame': ['Shift+A'],
+    'set_start': ['Q'],
+    'set_stop': ['E'],
+    'commit': ['C'],
+    'undo': ['Ctrl+Z', 'Z'],
+    'reset': ['Escape'],
+    'select_class': ['1', '2', '3', '4', '5', '6', '7', '8', '9'],
+}
+
+
+def load_hotkeys(path=DEFAULT_HOTKEYS_PATH):
+    """ Returns {command: list of keys} overriding `DEFAULT_HOTKEYS`, read from the json file at `path` if it exists """
+    if not osp.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            overrides = json.load(f)
+    except (OSError, ValueError) as e:
+        print("Could not read hotkeys from {}: {}".format(path, e))
+        return {}
+
+    hotkeys = {}
+    for command, keys in overrides.items():
+        if command not in DEFAULT_HOTKEYS:
+            print("Unknown hotkey command in {}: {}".format(path, command))
+            continue
+        hotkeys[command] = [keys] if isinstance(keys, str) else list(keys)
+    return hotkeys
+
+
+def key_bindings(overrides=None, normalize=str):
+    """Returns {key: (command, argument)}, the command run by each key of `DEFAULT_HOTKEYS` updated by `overrides`.
+
+    `normalize` maps a key to the form it is looked up by (the annotator uses Qt's portable key sequence text). The
+    argument is the class index for ``select_class`` and None otherwise. Overridden keys are bound after the defaults
+    and take their keys from other commands; a key given to several commands in `overrides` runs the last one.
+    """
+    overrides = overrides or {}
+    bindings = {}
+    for command, keys in DEFAULT_HOTKEYS.items():
+        if command not in overrides:
+            bind_keys(bindings, command, keys, normalize)
+
+    overridden = {}  # key -> command it was given to by `overrides`
+    for command, keys in overrides.items():
+        for key, previous in bind_keys(bindings, command, keys, normalize):
+            if overridden.get(key, command) != command:
+                print("Hotkey {} is given to both {} and {}, it runs {}".format(key, previous, command, command))
+            overridden[key] = command
+    return bindings
+
+
+def bind_keys(bindings, command, keys, normalize):
+    """ Binds `keys` to `command` in `bindings`, returns (key, command it was bound to before or None) of each key """
+    replaced = []
+    for i, key in enumerate(keys):
+        key = normalize(key)
+        previous = bindings.get(key)
+        bindings[key] = (command, i if command == 'select_class' else None)
+        replaced.append((key, previous[0] if previous is not None else None))
+    return replaced
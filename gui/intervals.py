@@ -0,0 +1,102 @@
+import heapq
+
+import numpy as np
+
+START_FRAME_COL = 5  # position of start_frame and stop_frame in annotation rows
+STOP_FRAME_COL = 6
+
+
+def frame_number(value):
+    """ Returns frame number of a start_frame/stop_frame value (an int, or a string when just added), -1 if missing """
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return -1
+
+
+class IntervalIndex(object):
+    """Frame intervals of the annotations of one video, sorted by start frame.
+
+    ``max_stops[i]`` is the largest stop frame among the first ``i + 1`` intervals. It never decreases, so the
+    intervals that may contain a frame lie between the first one whose ``max_stops`` reaches the frame and the last one
+    starting before it, both found by binary search. Only that range is scanned, which stays small unless intervals
+    are very long.
+
+    ``rows`` holds the position of each interval in the annotations list it was built from. `appended` and `removed`
+    return the index of the list after an edit without re-reading every row.
+    """
+
+    def __init__(self, starts, stops, rows, presorted=False):
+        order = slice(None) if presorted else np.argsort(starts, kind='stable')
+        self.starts = np.asarray(starts, dtype=np.int64)[order]
+        self.stops = np.maximum(np.asarray(stops, dtype=np.int64)[order], self.starts)
+        self.rows = np.asarray(rows, dtype=np.int64)[order]
+        self.max_stops = np.maximum.accumulate(self.stops) if len(self.stops) else self.stops
+
+    @classmethod
+    def from_annotations(cls, annotations_list):
+        """ Indexes the start_frame-stop_frame interval of every annotation row (rows without frames are skipped) """
+        starts = [frame_number(row[START_FRAME_COL]) for row in annotations_list]
+        stops = [frame_number(row[STOP_FRAME_COL]) for row in annotations_list]
+        rows = [i for i, start in enumerate(starts) if start >= 0]
+        return cls([starts[i] for i in rows], [stops[i] for i in rows], rows)
+
+    def appended(self, row, position):
+        """ Returns the index after annotation `row` was appended to the annotations list, at `position` """
+        start, stop = frame_number(row[START_FRAME_COL]), frame_number(row[STOP_FRAME_COL])
+        if start < 0:
+            return self
+        i = np.searchsorted(self.starts, start, side='right')
+        return IntervalIndex(np.insert(self.starts, i, start), np.insert(self.stops, i, stop),
+                             np.insert(self.rows, i, position), presorted=True)
+
+    def removed(self, position):
+        """ Returns the index after the annotation at `position` was removed from the annotations list """
+        keep = self.rows != position
+        rows = self.rows[keep]
+        return IntervalIndex(self.starts[keep], self.stops[keep], rows - (rows > position), presorted=True)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlapping(self, start, stop):
+        """ Returns positions (in the annotations list) of the intervals overlapping frames `start` to `stop` """
+        lo = np.searchsorted(self.max_stops, start, side='left')
+        hi = np.searchsorted(self.starts, stop, side='right')
+        if lo >= hi:
+            return np.empty(0, dtype=np.int64)
+        candidates = slice(lo, hi)
+        return np.sort(self.rows[candidates][self.stops[candidates] >= start])
+
+    def covering(self, frame):
+        """ Returns positions (in the annotations list) of the intervals containing `frame` """
+        return self.overlapping(frame, frame)
+
+    def lanes(self):
+        """Assigns each interval (in sorted order) the lowest lane free at its start, so that intervals sharing a lane
+        do not overlap. Returns (lanes, number of lanes)."""
+        lanes = np.zeros(len(self.starts), dtype=np.int64)
+        busy = []  # (stop frame, lane) of the last interval of each lane
+        free = []
+        for i, (start, stop) in enumerate(zip(self.starts.tolist(), self.stops.tolist())):
+            while busy and busy[0][0] < start:
+                heapq.heappush(free, heapq.heappop(busy)[1])
+            lane = heapq.heappop(free) if free else len(busy)
+            heapq.heappush(busy, (stop, lane))
+            lanes[i] = lane
+        return lanes, int(lanes.max()) + 1 if len(lanes) else 0
+
+    def conflicts(self, annotations_list, row):
+        """Checks new annotation `row` against existing ones of the same player overlapping it.
+
+        Returns (duplicates, overlaps): positions of annotations of the same action, and of other actions.
+        """
+        start, stop = frame_number(row[START_FRAME_COL]), frame_number(row[STOP_FRAME_COL])
+        action, player_id = row[1], str(row[2])
+        duplicates, overlaps = [], []
+        for i in self.overlapping(start, max(stop, start)).tolist():
+            other = annotations_list[i]
+            if str(other[2]) != player_id:
+                continue
+            (duplicates if other[1] == action else overlaps).append(i)
+        return duplicates, overlaps
@@ -0,0 +1,83 @@
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, pyqtSignal
+from PyQt5.QtWidgets import QListView
+
+
+TRACK_COVERAGE_COL = 10  # position of track_coverage in annotation rows
+
+
+def format_annotation(row):
+    """Formats annotation row as 'action, player_id, start_time (s), stop_time (s), start_frame, stop_frame', followed
+    by the coverage of the player's track once it was validated."""
+    text = ', '.join(str(elem) for elem in row[1:7])
+    coverage = row[TRACK_COVERAGE_COL] if len(row) > TRACK_COVERAGE_COL else None
+    if coverage is not None and coverage == coverage:  # NaN until validated
+        text += ', {:.0%}'.format(float(coverage))
+    return text
+
+
+class SequenceListModel(QAbstractListModel):
+    """Read-only list model over a Python sequence, e.g. video names or annotation rows.
+
+    No item is created per row: the view only asks for the rows it displays, and their strings are formatted with
+    ``formatter`` at that time. The model does not copy ``rows``; ``append`` and ``pop`` edit it in place and notify
+    the view, so the sequence can be shared with the rest of the annotator.
+    """
+
+    def __init__(self, rows=None, formatter=str, parent=None):
+        super(SequenceListModel, self).__init__(parent)
+        self.rows = rows if rows is not None else []
+        self.formatter = formatter
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            return self.formatter(self.rows[index.row()])
+        return None
+
+    def set_rows(self, rows):
+        """ Replaces the underlying sequence """
+        self.beginResetModel()
+        self.rows = rows
+        self.endResetModel()
+
+    def append(self, row):
+        n = len(self.rows)
+        self.beginInsertRows(QModelIndex(), n, n)
+        self.rows.append(row)
+        self.endInsertRows()
+
+    def pop(self, index):
+        self.beginRemoveRows(QModelIndex(), index, index)
+        row = self.rows.pop(index)
+        self.endRemoveRows()
+        return row
+
+    def refresh(self, first=0, last=None):
+        """ Notifies the view that rows `first` to `last` (default: all) changed in place """
+        last = len(self.rows) - 1 if last is None else last
+        if last >= first:
+            self.dataChanged.emit(self.index(first), self.index(last))
+
+
+class RowListView(QListView):
+    """ QListView over a `SequenceListModel`, with the row based interface of QListWidget used by the annotator """
+
+    currentRowChanged = pyqtSignal(int)
+
+    def __init__(self, model, parent=None):
+        super(RowListView, self).__init__(parent)
+        self.setModel(model)
+        self.setUniformItemSizes(True)  # rows are laid out without measuring each of them
+        self.selectionModel().currentRowChanged.connect(
+            lambda current, previous: self.currentRowChanged.emit(current.row()))
+
+    def currentRow(self):
+        return self.currentIndex().row()
+
+    def setCurrentRow(self, row):
+        self.setCurrentIndex(self.model().index(row))
+
+    def count(self):
+        return self.model().rowCount()
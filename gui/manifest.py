@@ -0,0 +1,189 @@
+"""Persistent manifest of the videos of a dataset.
+
+Usage
+    python manifest.py <root_dir> [--workers N]
+
+The manifest (``<root_dir>/manifest.json``) caches, for every folder of ``videos_tracked``, whether its video and
+tracking files exist, the video duration, fps, frame count and resolution, the number of tracking rows and the number
+of annotations. Refreshing it stats every folder in a thread pool and only re-reads the files whose mtime or size
+changed, so the video list can be shown from the previous manifest immediately and updated once the refresh is done.
+"""
+import os
+import sys
+import json
+import argparse
+import os.path as osp
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from cache import load_cached_array
+from tracking import tracking_cache_path, TRACKING_CACHE_VERSION
+from annotation_store import AnnotationLog, LOG_SUFFIX
+from annotation_db import AnnotationDB, db_path
+
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_VERSION = 1
+
+
+def file_stat(dir_entries, file_name):
+    """ Returns [mtime_ns, size] of `file_name` from scandir entries, or None if it does not exist """
+    entry = dir_entries.get(file_name)
+    if entry is None:
+        return None
+    st = entry.stat()
+    return [st.st_mtime_ns, st.st_size]
+
+
+def count_tracking_rows(tracking_txt_path):
+    """ Returns number of rows of a tracking file, from its binary cache when it is up to date """
+    records = load_cached_array(tracking_cache_path(tracking_txt_path), tracking_txt_path, TRACKING_CACHE_VERSION)
+    if records is not None:
+        return len(records)
+
+    num_lines = 0
+    last_chunk = b'\n'
+    with open(tracking_txt_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            num_lines += chunk.count(b'\n')
+            last_chunk = chunk
+    num_lines += not last_chunk.endswith(b'\n')
+    return max(num_lines - 1, 0)  # header row
+
+
+def probe_video(video_path):
+    """ Returns fps, frame count, width and height of a video """
+    cap = cv2.VideoCapture(video_path)
+    info = {'fps': cap.get(cv2.CAP_PROP_FPS),
+            'num_frames': int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+            'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))}
+    cap.release()
+    info['duration_s'] = info['num_frames'] / info['fps'] if info['fps'] else 0.
+    return info
+
+
+def scan_video(videos_tracked_dir, annotations_dir, annotation_entries, name, previous):
+    """ Returns the manifest entry of video `name`, reusing fields of `previous` whose source files did not change """
+    entry = dict(previous) if previous else {}
+    entry['name'] = name
+    video_dir = osp.join(videos_tracked_dir, name)
+    try:
+        with os.scandir(video_dir) as it:
+            dir_entries = {e.name: e for e in it}
+    except OSError:
+        dir_entries = {}
+
+    video_stat = file_stat(dir_entries, name + '.mp4')
+    tracking_stat = file_stat(dir_entries, name + '.txt')
+    annotations_stat = [file_stat(annotation_entries, name + '.csv'),
+                        file_stat(annotation_entries, name + '.csv' + LOG_SUFFIX)]
+
+    errors = []
+    if video_stat is None:
+        errors.append('missing {}.mp4'.format(name))
+    else:
+        if entry.get('video_stat') != video_stat or 'fps' not in entry:
+            entry.update(probe_video(osp.join(video_dir, name + '.mp4')))
+        if not entry['fps']:
+            errors.append('unreadable {}.mp4'.format(name))
+
+    if tracking_stat is None:
+        errors.append('missing {}.txt'.format(name))
+    elif entry.get('tracking_stat') != tracking_stat or 'tracking_rows' not in entry:
+        entry['tracking_rows'] = count_tracking_rows(osp.join(video_dir, name + '.txt'))
+
+    if entry.get('annotations_stat') != annotations_stat or 'num_annotations' not in entry:
+        if annotations_stat == [None, None]:
+            entry['num_annotations'] = 0
+        else:
+            entry['num_annotations'] = len(AnnotationLog(osp.join(annotations_dir, name + '.csv')).load()[0])
+
+    entry['video_stat'] = video_stat
+    entry['tracking_stat'] = tracking_stat
+    entry['annotations_stat'] = annotations_stat
+    entry['errors'] = errors
+    entry['valid'] = not errors
+    return entry
+
+
+class Manifest(object):
+    """ Manifest entries of every video of a dataset, keyed by video name """
+
+    def __init__(self, root_dir, entries=None):
+        self.root_dir = root_dir
+        self.videos_tracked_dir = osp.join(root_dir, 'videos_tracked')
+        self.annotations_dir = osp.join(root_dir, 'annotations')
+        self.path = osp.join(root_dir, MANIFEST_FILE)
+        self.entries = entries if entries is not None else {}
+
+    @property
+    def names(self):
+        return sorted(self.entries)
+
+    @classmethod
+    def load(cls, root_dir):
+        """ Loads the manifest saved in `root_dir`, or an empty one if there is none """
+        try:
+            with open(osp.join(root_dir, MANIFEST_FILE)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls(root_dir)
+        if data.get('version') != MANIFEST_VERSION:
+            return cls(root_dir)
+        return cls(root_dir, data['entries'])
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'entries': self.entries}, f)
+        os.replace(tmp_path, self.path)
+
+    def refresh(self, workers=16):
+        """ Rescans the dataset, returns a new manifest (this one is left untouched) """
+        with os.scandir(self.videos_tracked_dir) as it:
+            names = [e.name for e in it if '.' not in e.name and e.is_dir()]
+        with os.scandir(self.annotations_dir) as it:
+            annotation_entries = {e.name: e for e in it}
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            entries = executor.map(
+                lambda name: scan_video(self.videos_tracked_dir, self.annotations_dir, annotation_entries, name,
+                                        self.entries.get(name)), names)
+            manifest = Manifest(self.root_dir, {entry['name']: entry for entry in entries})
+
+        # annotations saved to the dataset's database are counted there, in one query
+        if osp.exists(db_path(self.root_dir)):
+            counts = AnnotationDB(db_path(self.root_dir)).counts('video')
+            for name, entry in manifest.entries.items():
+                entry['num_annotations'] = counts.get(name, 0)
+        return manifest
+
+
+def format_video_entry(name, entry):
+    """ Formats a row of the videos list: video name and annotation progress or errors """
+    if entry is None:
+        return name
+    if not entry['valid']:
+        return '{}  (ERROR: {})'.format(name, ', '.join(entry['errors']))
+    return '{}  [{}]'.format(name, entry['num_annotations'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build or refresh the manifest of a dataset')
+    parser.add_argument('root_dir', help='directory containing the videos_tracked and annotations folders')
+    parser.add_argument('--workers', type=int, default=16, help='number of threads statting video folders')
+    args = parser.parse_args(argv)
+
+    manifest = Manifest.load(args.root_dir).refresh(args.workers)
+    manifest.save()
+    invalid = [entry for entry in manifest.entries.values() if not entry['valid']]
+    for entry in invalid:
+        print("{}: {}".format(entry['name'], ', '.join(entry['errors'])))
+    print("{} videos, {} invalid, {} annotations".format(
+        len(manifest.entries), len(invalid), sum(entry['num_annotations'] for entry in manifest.entries.values())))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,230 @@
+import os.path as osp
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError
+
+import cv2
+
+from tracking import TrackingIndex
+from frame_index import FrameIndex, cancel_builds as cancel_frame_index_builds
+from annotation_store import AnnotationLog
+from proxy import (proxy_path, needs_proxy, is_proxy_fresh, probe_size,
+                   build_in_background as build_proxy_in_background, cancel_builds as cancel_proxy_builds)
+from profiling import profiler
+
+WRITE_WAIT_TIMEOUT = 5.0  # seconds a load waits for queued edits of its annotations to be written
+
+
+class VideoData(object):
+    """Everything `ActionAnnotator.set_video` needs to display one video: probe results, tracking and annotations.
+
+    ``playback_path`` is the file played and decoded for display, i.e. the video or its low resolution proxy, of size
+    ``playback_width`` x ``playback_height``. Tracking boxes and clicks always use the original ``vid_width`` x
+    ``vid_height`` pixel space.
+    """
+
+    def __init__(self, name, video_path, fps, num_frames, vid_width, vid_height, frame_index, tracking_annotations,
+                 annotation_log, annotations_list, annotations_col_names, playback_path=None, playback_width=None,
+                 playback_height=None):
+        self.name = name
+        self.video_path = video_path
+        self.fps = fps
+        self.num_frames = num_frames
+        self.vid_width = vid_width
+        self.vid_height = vid_height
+        self.frame_index = frame_index
+        self.tracking_annotations = tracking_annotations
+        self.annotation_log = annotation_log
+        self.annotations_list = annotations_list
+        self.annotations_col_names = annotations_col_names
+        self.playback_path = playback_path or video_path
+        self.playback_width = playback_width or vid_width
+        self.playback_height = playback_height or vid_height
+        self.proxy_height = None  # height of the proxy to transcode, when it is missing or stale
+
+    @property
+    def nbytes(self):
+        """ Approximate resident memory held by this video's data (memory mapped tracking data is not counted) """
+        return self.tracking_annotations.nbytes + 256 * len(self.annotations_list)
+
+    def start_builds(self):
+        """Starts probing the exact frame index of this video and transcoding its proxy in the background, if needed.
+
+        Both decode the whole video, so they are only started for the opened video, not for prefetched ones, and
+        `cancel_background_builds` stops them when the user moves on.
+        """
+        if not self.frame_index.exact:
+            FrameIndex.build_in_background(self.video_path).add_done_callback(self.frame_index_built)
+        if self.proxy_height is not None:
+            build_proxy_in_background(self.video_path, self.proxy_height).add_done_callback(self.proxy_built)
+
+    def frame_index_built(self, future):
+        """ Replaces the estimated frame index by the probed one once its background build is done """
+        try:
+            self.frame_index = future.result()
+        except CancelledError:
+            pass
+        except Exception as e:
+            print("Could not build frame index of {}: {}".format(self.video_path, e))
+
+    def proxy_built(self, future):
+        """ Plays the proxy once its background transcode is done, from the next time the video is opened """
+        try:
+            path = future.result()
+        except CancelledError:
+            return
+        except Exception as e:
+            print("Could not build proxy of {}: {}".format(self.video_path, e))
+            return
+        self.playback_width, self.playback_height = probe_size(path)
+        self.playback_path = path
+        self.proxy_height = None
+
+
+def load_video_data(videos_tracked_dir, annotations_dir, name, annotation_db=None, proxy_height=None,
+                    annotation_writer=None):
+    """Probes video `name`, loads its frame and tracking indexes and its annotations.
+
+    Annotations are read from `annotation_db` if given, otherwise from the csv in `annotations_dir` and its log, once
+    `annotation_writer` has written the edits still queued for them (IOError if it could not within
+    ``WRITE_WAIT_TIMEOUT`` seconds, rather than returning annotations missing them). With
+    `proxy_height`, videos higher than that are played from their proxy. When it is missing or stale, the video is
+    played as is and `VideoData.start_builds` transcodes the proxy once the video is opened.
+    """
+    video_path = osp.join(videos_tracked_dir, name, name + '.mp4')
+    with profiler.span('probe_video'):
+        cap_vid_tracked = cv2.VideoCapture(video_path)
+        fps = cap_vid_tracked.get(cv2.CAP_PROP_FPS)
+        num_frames = int(cap_vid_tracked.get(cv2.CAP_PROP_FRAME_COUNT))
+        vid_height = cap_vid_tracked.get(cv2.CAP_PROP_FRAME_HEIGHT)
+        vid_width = cap_vid_tracked.get(cv2.CAP_PROP_FRAME_WIDTH)
+        cap_vid_tracked.release()
+
+    # exact frame timestamps, estimated from the frame rate until `VideoData.start_builds` probes them
+    frame_index = FrameIndex.load_cached(video_path)
+    if frame_index is None:
+        frame_index = FrameIndex.constant_rate(num_frames, fps)
+
+    with profiler.span('load_tracking'):
+        tracking_annotations = TrackingIndex.load(osp.join(videos_tracked_dir, name, name + '.txt'))
+
+    if annotation_db is not None:
+        annotation_log = annotation_db.video(name)
+    else:
+        annotation_log = AnnotationLog(osp.join(annotations_dir, name + '.csv'))
+    with profiler.span('load_annotations'):
+        if annotation_writer is not None and not annotation_writer.wait_written(annotation_log, WRITE_WAIT_TIMEOUT):
+            raise IOError("Edits of {} are not saved yet, retry once they are".format(annotation_log.location))
+        annotations_list, annotations_col_names = annotation_log.load()
+
+    video_data = VideoData(name, video_path, fps, num_frames, vid_width, vid_height, frame_index,
+                           tracking_annotations, annotation_log, annotations_list, annotations_col_names)
+    if proxy_height is not None and needs_proxy(vid_height, proxy_height):
+        if is_proxy_fresh(video_path, proxy_height):
+            video_data.playback_path = proxy_path(video_path)
+            video_data.playback_width, video_data.playback_height = probe_size(video_data.playback_path)
+        else:
+            video_data.proxy_height = proxy_height
+    return video_data
+
+
+def cancel_background_builds(keep=None):
+    """ Stops the background builds of every video but the one at path `keep`, when the user opens another video """
+    cancel_frame_index_builds(keep)
+    cancel_proxy_builds(keep)
+
+
+class Prefetcher(object):
+    """Bounded LRU cache of loaded items, filled ahead of time by a background worker thread.
+
+    ``prefetch`` replaces the queue of items to load, so requests for videos the user navigated away from are dropped
+    before they are loaded. ``get`` returns a cached item immediately, waits for it if the worker is currently loading
+    it, or loads it on the calling thread otherwise. The cache holds at most ``max_items`` items and evicts least
+    recently used items once their ``nbytes`` add up to more than ``max_bytes``.
+    """
+
+    def __init__(self, loader, max_items=5, max_bytes=512 * 1024 ** 2):
+        self.loader = loader
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+
+        self._cache = OrderedDict()
+        self._queue = []
+        self._in_flight = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._worker = threading.Thread(target=self._run, name='prefetcher', daemon=True)
+        self._worker.start()
+
+    def get(self, key):
+        """ Returns item `key`, from the cache if possible """
+        with self._cond:
+            if key in self._queue:
+                self._queue.remove(key)
+            while self._in_flight == key:
+                self._cond.wait()
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        item = self.loader(key)
+        with self._cond:
+            self._store(key, item)
+        return item
+
+    def usage(self):
+        """ Returns (number of cached items, their total ``nbytes``) """
+        with self._cond:
+            return len(self._cache), sum(item.nbytes for item in self._cache.values())
+
+    def prefetch(self, keys):
+        """ Replaces pending requests by `keys` (in priority order), skipping those already cached """
+        with self._cond:
+            self._queue = [key for key in keys if key not in self._cache and key != self._in_flight]
+            self._cond.notify_all()
+
+    def cancel(self):
+        """ Drops all pending requests """
+        self.prefetch([])
+
+    def invalidate(self, key):
+        """ Removes `key` from the cache so that it is reloaded on next access """
+        with self._cond:
+            self._cache.pop(key, None)
+
+    def shutdown(self):
+        """ Stops the worker thread and clears the cache """
+        with self._cond:
+            self._closed = True
+            self._queue = []
+            self._cache.clear()
+            self._cond.notify_all()
+
+    def _store(self, key, item):
+        self._cache[key] = item
+        self._cache.move_to_end(key)
+        while len(self._cache) > 1 and (len(self._cache) > self.max_items or
+                                        sum(v.nbytes for v in self._cache.values()) > self.max_bytes):
+            self._cache.popitem(last=False)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                key = self._in_flight = self._queue.pop(0)
+
+            try:
+                item = self.loader(key)
+            except Exception as e:
+                # failures are reported when the item is actually requested
+                print("Prefetching {} failed: {}".format(key, e))
+                item = None
+
+            with self._cond:
+                if item is not None and not self._closed:
+                    self._store(key, item)
+                self._in_flight = None
+                self._cond.notify_all()
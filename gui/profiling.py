@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import threading
+from collections import defaultdict, deque
+
+
+class Span(object):
+    """ Times the enclosed block and records it in its `Profiler` """
+
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.record(self.name, self.start, time.perf_counter() - self.start)
+        return False
+
+
+class NullSpan(object):
+    """ Span of a disabled profiler: does nothing """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Profiler(object):
+    """Opt-in latency instrumentation of the annotator's hot paths.
+
+    Code paths are timed with ``with profiler.span(name):``, or with `begin`/`end` for latencies ending in another
+    callback (e.g. a media player seek ending when its position is reported). The last ``window`` durations of each
+    name are kept to compute percentiles, and every span is kept as a Chrome trace event (up to ``max_events``) so
+    that `dump` can write a file loadable in chrome://tracing or Perfetto. When disabled, spans cost one attribute
+    lookup and nothing is recorded.
+    """
+
+    def __init__(self, enabled=False, window=1000, max_events=200000):
+        self.enabled = enabled
+        self.window = window
+        self.origin = time.perf_counter()
+        self.durations = defaultdict(lambda: deque(maxlen=self.window))  # name -> last durations (s)
+        self.counts = defaultdict(int)
+        self.events = deque(maxlen=max_events)
+        self.thread_names = {}
+        self.pending = {}  # name -> start time of latencies begun but not ended yet
+        self._lock = threading.Lock()
+
+    def span(self, name):
+        return Span(self, name) if self.enabled else NULL_SPAN
+
+    def begin(self, name):
+        """ Starts timing latency `name`, restarting it if it was already begun """
+        if self.enabled:
+            self.pending[name] = time.perf_counter()
+
+    def end(self, name):
+        """ Records latency `name` if it was begun """
+        start = self.pending.pop(name, None) if self.enabled else None
+        if start is not None:
+            self.record(name, start, time.perf_counter() - start)
+
+    def record(self, name, start, duration):
+        """ Records that `name` took `duration` seconds from perf_counter time `start` """
+        thread = threading.current_thread()
+        with self._lock:
+            self.durations[name].append(duration)
+            self.counts[name] += 1
+            self.thread_names[thread.ident] = thread.name
+            self.events.append((name, start, duration, thread.ident))
+
+    def percentiles(self, name, quantiles=(0.5, 0.95)):
+        """ Returns `quantiles` (nearest rank) of the last recorded durations of `name`, in seconds """
+        with self._lock:
+            durations = sorted(self.durations.get(name, ()))
+        if not durations:
+            return [None] * len(quantiles)
+        return [durations[min(int(q * len(durations)), len(durations) - 1)] for q in quantiles]
+
+    def summary(self):
+        """ Returns {name: {'count', 'p50_ms', 'p95_ms', 'max_ms'}} over the last recorded durations """
+        with self._lock:
+            names = sorted(self.durations)
+        summary = {}
+        for name in names:
+            p50, p95, p100 = self.percentiles(name, (0.5, 0.95, 1.))
+            summary[name] = {'count': self.counts[name], 'p50_ms': p50 * 1e3, 'p95_ms': p95 * 1e3,
+                             'max_ms': p100 * 1e3}
+        return summary
+
+    def summary_text(self, max_items=3):
+        """ Returns p50/p95 of the `max_items` names with the highest p95, as a one line string """
+        summary = sorted(self.summary().items(), key=lambda item: -item[1]['p95_ms'])
+        return '  '.join('{} {:.0f}/{:.0f}ms'.format(name, stats['p50_ms'], stats['p95_ms'])
+                         for name, stats in summary[:max_items])
+
+    def dump(self, path):
+        """ Writes recorded spans as a Chrome trace (JSON object format), with the percentiles summary """
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+            thread_names = dict(self.thread_names)
+        trace_events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': thread_name}}
+                        for tid, thread_name in thread_names.items()]
+        trace_events.extend({'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+                             'ts': (start - self.origin) * 1e6, 'dur': duration * 1e6}
+                            for name, start, duration, tid in events)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms', 'summary': self.summary()}, f)
+
+
+class Throughput(object):
+    """Annotations added per minute of work, to measure labelling throughput.
+
+    Working time is the time between consecutive annotation actions (setting times, clicking players, adding), each
+    gap counted up to ``idle_after`` seconds so that breaks do not lower the rate.
+    """
+
+    def __init__(self, idle_after=60.):
+        self.idle_after = idle_after
+        self.count = 0
+        self.active_s = 0.
+        self._last = None
+
+    def activity(self):
+        """ Records an annotation action now """
+        now = time.monotonic()
+        if self._last is not None:
+            self.active_s += min(now - self._last, self.idle_after)
+        self._last = now
+
+    def added(self):
+        self.activity()
+        self.count += 1
+
+    def undone(self):
+        self.activity()
+        self.count = max(self.count - 1, 0)
+
+    def per_minute(self):
+        """ Returns annotations per minute of working time, None until there is some """
+        return self.count / (self.active_s / 60.) if self.active_s > 0 else None
+
+
+def resident_memory():
+    """ Returns resident set size of this process in bytes, or None where /proc is not available """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+profiler = Profiler()  # shared by every module, enabled by the annotator's --profile option
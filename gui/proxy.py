@@ -0,0 +1,165 @@
+"""Low resolution proxies of the videos of a dataset, played instead of the originals.
+
+Usage
+    python proxy.py <root_dir> [--height 720] [--gop 12] [--workers N] [--force]
+
+A proxy (``<name>.proxy.mp4``, next to ``<name>.mp4``) is the video downscaled to ``height`` lines with a keyframe
+every ``gop`` frames, so it decodes smoothly and seeks fast on laptops that stutter on 4K footage. Frame timestamps are
+copied from the original, so frame numbers, the frame timestamp cache and the tracking data stay valid. The annotator
+started with ``--proxy`` plays the proxy when it is up to date and transcodes missing ones in the background; this
+command builds them for a whole dataset ahead of time. Transcoding uses the ``ffmpeg`` executable.
+"""
+import os
+import sys
+import shutil
+import argparse
+import subprocess
+import threading
+import os.path as osp
+from concurrent.futures import ThreadPoolExecutor, CancelledError, as_completed
+
+import cv2
+
+from cache import source_signature, is_cache_fresh, save_cache_meta
+from build_caches import list_video_dirs
+
+PROXY_VERSION = 1
+PROXY_SUFFIX = '.proxy.mp4'
+PROXY_HEIGHT = 720
+PROXY_GOP = 12
+
+_build_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='proxy')
+_build_futures = {}
+_build_cancel_events = {}  # video path -> event stopping its running transcode
+_build_futures_lock = threading.Lock()
+
+
+def proxy_path(video_path):
+    """ Returns path of the proxy sitting next to `video_path` """
+    return osp.splitext(video_path)[0] + PROXY_SUFFIX
+
+
+def proxy_version(height, gop):
+    """ Proxies built with other settings are stale """
+    return [PROXY_VERSION, height, gop]
+
+
+def needs_proxy(vid_height, height):
+    """ Checks whether videos `vid_height` lines high are larger than their proxy would be """
+    return vid_height > height
+
+
+def is_proxy_fresh(video_path, height=PROXY_HEIGHT, gop=PROXY_GOP):
+    return is_cache_fresh(proxy_path(video_path), video_path, proxy_version(height, gop))
+
+
+def transcode_command(video_path, out_path, height, gop):
+    """ Returns the ffmpeg command writing the proxy of `video_path` to `out_path` """
+    return ['ffmpeg', '-nostdin', '-y', '-loglevel', 'error', '-i', video_path,
+            '-map', '0:v:0', '-map', '0:a?', '-vf', 'scale=-2:{}'.format(height),
+            '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23', '-pix_fmt', 'yuv420p',
+            '-g', str(gop), '-keyint_min', str(gop), '-sc_threshold', '0', '-vsync', 'passthrough',
+            '-c:a', 'aac', '-b:a', '96k', '-movflags', '+faststart', '-f', 'mp4', out_path]
+
+
+def build_proxy(video_path, height=PROXY_HEIGHT, gop=PROXY_GOP, cancelled=None):
+    """Transcodes the proxy of `video_path`, returns its path.
+
+    The proxy is written to a temporary name and renamed into place, and marked with the signature of the original
+    taken before transcoding, as caches are, so an interrupted or outdated transcode is seen as stale. Setting event
+    `cancelled` kills ffmpeg and raises `CancelledError`.
+    """
+    if shutil.which('ffmpeg') is None:
+        raise IOError("ffmpeg is required to build proxies but was not found")
+    signature = source_signature(video_path)
+    path = proxy_path(video_path)
+    tmp_path = path + '.tmp'
+    process = subprocess.Popen(transcode_command(video_path, tmp_path, height, gop), stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE)
+    while True:
+        try:
+            _, stderr = process.communicate(timeout=0.5)
+            break
+        except subprocess.TimeoutExpired:
+            if cancelled is not None and cancelled.is_set():
+                process.kill()
+                process.communicate()
+                stderr = None
+                break
+    if process.returncode != 0:
+        if osp.exists(tmp_path):
+            os.remove(tmp_path)
+        if stderr is None:
+            raise CancelledError("Transcoding {} was cancelled".format(video_path))
+        raise IOError("Could not transcode {}: {}".format(video_path, stderr.decode(errors='replace').strip()))
+    os.replace(tmp_path, path)
+    save_cache_meta(path, signature, proxy_version(height, gop))
+    return path
+
+
+def build_in_background(video_path, height=PROXY_HEIGHT, gop=PROXY_GOP):
+    """Starts building the proxy of `video_path` on the proxy thread, returns a future of its path.
+
+    Only the opened video should be transcoded: `cancel_builds` stops transcodes of videos the user navigated away from.
+    """
+    with _build_futures_lock:
+        future = _build_futures.get(video_path)
+        if future is None or future.done():
+            cancelled = _build_cancel_events[video_path] = threading.Event()
+            future = _build_futures[video_path] = _build_executor.submit(build_proxy, video_path, height, gop,
+                                                                         cancelled)
+        return future
+
+
+def cancel_builds(keep=None):
+    """ Cancels the transcodes of every video but `keep`: queued ones are dropped and the running one is killed """
+    with _build_futures_lock:
+        for video_path, future in _build_futures.items():
+            if video_path != keep and not future.done():
+                future.cancel()
+                _build_cancel_events[video_path].set()
+
+
+def probe_size(video_path):
+    """ Returns width and height of a video """
+    cap = cv2.VideoCapture(video_path)
+    size = cap.get(cv2.CAP_PROP_FRAME_WIDTH), cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+    cap.release()
+    return size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build low resolution playback proxies for a videos_tracked tree')
+    parser.add_argument('root_dir', help='directory containing the videos_tracked folder')
+    parser.add_argument('--height', type=int, default=PROXY_HEIGHT, help='height of the proxies, in pixels')
+    parser.add_argument('--gop', type=int, default=PROXY_GOP, help='frames between keyframes of the proxies')
+    parser.add_argument('--workers', type=int, default=2, help='number of ffmpeg processes run at once')
+    parser.add_argument('--force', action='store_true', help='rebuild proxies even if they are up to date')
+    args = parser.parse_args(argv)
+
+    videos_tracked_dir = osp.join(args.root_dir, 'videos_tracked')
+    if not osp.isdir(videos_tracked_dir):
+        print("ERROR: {} does not exist".format(videos_tracked_dir))
+        return 1
+
+    video_paths = [osp.join(video_dir, name + '.mp4') for name, video_dir in list_video_dirs(videos_tracked_dir)]
+    todo = [path for path in video_paths if osp.exists(path) and needs_proxy(probe_size(path)[1], args.height) and
+            (args.force or not is_proxy_fresh(path, args.height, args.gop))]
+    print("{} videos, {} proxies to build".format(len(video_paths), len(todo)))
+
+    num_failed = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(build_proxy, path, args.height, args.gop): path for path in todo}
+        for i, future in enumerate(as_completed(futures)):
+            try:
+                print("[{}/{}] built {}".format(i + 1, len(todo), future.result()))
+            except Exception as e:
+                num_failed += 1
+                print("[{}/{}] FAILED {}: {}".format(i + 1, len(todo), futures[future], e))
+
+    print("Done: {} built, {} failed".format(len(todo) - num_failed, num_failed))
+    return 1 if num_failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import os
+import json
+import threading
+import os.path as osp
+
+JOURNAL_VERSION = 1
+CONFIG_DIR = osp.join(osp.expanduser('~'), '.action_annotator')  # per user files of the annotator
+DEFAULT_JOURNAL_PATH = osp.join(CONFIG_DIR, 'session.json')
+
+
+def load_session(path=DEFAULT_JOURNAL_PATH):
+    """ Returns the last state saved by a `SessionJournal` at `path`, or None if there is none (or it is unreadable) """
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state if isinstance(state, dict) and state.get('version') == JOURNAL_VERSION else None
+
+
+class SessionJournal(object):
+    """Saves the annotator's in-progress state (dataset, video, playback position and the annotation being built) on a
+    background thread, so that it can be resumed after a crash or restart.
+
+    The GUI calls `update` with the current state as often as it likes; only the latest state is kept, and it is
+    written every ``interval`` seconds if it changed. Each write goes to a temporary file, is fsynced and renamed over
+    the journal, so the journal always holds a complete state.
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH, interval=2.0):
+        self.path = path
+        self.interval = interval
+
+        self._state = None
+        self._written = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._worker = threading.Thread(target=self._run, name='session-journal', daemon=True)
+        self._worker.start()
+
+    def update(self, state):
+        """ Sets the state to save next, a json serializable dict """
+        with self._cond:
+            self._state = dict(state, version=JOURNAL_VERSION)
+
+    def close(self):
+        """ Writes the latest state and stops the worker thread """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed:
+                    self._cond.wait(self.interval)
+                state, closed = self._state, self._closed
+            if state is not None and state != self._written:
+                try:
+                    self._write(state)
+                    self._written = state
+                except (OSError, TypeError, ValueError) as e:
+                    print("Could not save session to {}: {}".format(self.path, e))
+            if closed:
+                return
+
+    def _write(self, state):
+        os.makedirs(osp.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,66 @@
+import sys
+import time
+import threading
+import importlib
+
+START_TIME = time.perf_counter()  # as early as the first import of this module
+
+# Modules the window does not need to be shown, imported in the background once it is. `prefetch`, `frame_server`
+# and `annotation_session` pull in numpy, pandas and cv2.
+DEFERRED_MODULES = ['numpy', 'pandas', 'cv2', 'prefetch', 'frame_server', 'annotation_session']
+
+
+class StartupReport(object):
+    """Records how long each startup phase and deferred import took.
+
+    Phases are marked relative to the first import of this module. Deferred imports are timed one after the other, in
+    the spirit of ``python -X importtime``, so each time excludes dependencies already imported by earlier modules.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.phases = []
+        self.imports = []
+        self._lock = threading.Lock()
+
+    def mark(self, phase):
+        """ Records that startup phase `phase` just finished """
+        with self._lock:
+            self.phases.append((phase, time.perf_counter() - START_TIME))
+
+    def add_import(self, name, seconds):
+        with self._lock:
+            self.imports.append((name, seconds))
+
+    def print_report(self, file=sys.stderr):
+        if not self.enabled:
+            return
+        with self._lock:
+            print("startup phases (s since launch):", file=file)
+            for phase, t in self.phases:
+                print("  {:>8.3f} | {}".format(t, phase), file=file)
+            print("deferred imports:", file=file)
+            print("  {:>8} | {}".format('time [us]', 'module'), file=file)
+            for name, seconds in self.imports:
+                print("  {:>8d} | {}".format(int(seconds * 1e6), name), file=file)
+
+
+def import_deferred_modules(report, on_done=None):
+    """ Imports `DEFERRED_MODULES` on a background thread, so the first video opens without waiting for them """
+
+    def run():
+        for name in DEFERRED_MODULES:
+            t0 = time.perf_counter()
+            try:
+                importlib.import_module(name)
+            except ImportError as e:
+                print("Could not import {}: {}".format(name, e), file=sys.stderr)
+                continue
+            report.add_import(name, time.perf_counter() - t0)
+        report.mark('deferred imports done')
+        if on_done is not None:
+            on_done()
+
+    thread = threading.Thread(target=run, name='deferred-imports', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,15 @@
+def get_time_string(time_ms):
+    """ converts `time_ms` (int) to mm:ss (string) format """
+    # minutes:seconds
+    time_seconds = int(time_ms / 1000)
+    mins = int(time_seconds / 60)
+    secs = time_seconds - mins * 60
+
+    return "{:02d}:{:02d}".format(mins, secs)
+
+
+def get_time_seconds(time_string):
+    """ converts "{:02d}:{:02d}" (string) to time in seconds (int) """
+    time_lst = [int(x) for x in time_string.split(":")]
+    bases = [60, 1]
+    return sum([time_lst[i] * bases[i] for i in range(len(time_lst))])
@@ -0,0 +1,103 @@
+from PyQt5.QtGui import QColor, QPainter, QPixmap
+from PyQt5.QtCore import Qt, QRect, pyqtSignal
+from PyQt5.QtWidgets import QSizePolicy, QWidget
+
+
+def action_colours(classes_list):
+    """ Returns a distinct colour for each action of `classes_list`, spread around the hue circle """
+    n = max(len(classes_list), 1)
+    return {action: QColor.fromHsv(int(360 * i / n), 180, 230) for i, action in enumerate(classes_list)}
+
+
+class TimelineStrip(QWidget):
+    """Strip under the position slider showing the frame interval of every annotation and the current frame.
+
+    Intervals are stacked in lanes so that overlapping ones stay visible. Marked frame ranges (e.g. the gaps of a
+    player's track) are drawn as a red band along the bottom. Both are drawn once into a pixmap, again only when they
+    change or the strip is resized. Moving the current frame only repaints the few pixels of the old and new cursor.
+    Clicking the strip emits `frame_clicked` with the frame under the mouse.
+    """
+
+    frame_clicked = pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        super(TimelineStrip, self).__init__(parent)
+        self.setFixedHeight(18)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)  # the pixmap covers the whole strip
+
+        self.num_frames = 0
+        self.starts = []
+        self.stops = []
+        self.lanes = []
+        self.num_lanes = 0
+        self.colours = []
+        self.marks = ([], [])  # starts, stops of marked frame ranges
+        self.frame = None
+        self.pixmap = None  # rendered intervals, None when they have to be rendered again
+
+    def set_intervals(self, num_frames, starts, stops, lanes, num_lanes, colours):
+        """ Replaces drawn intervals by frames `starts` to `stops`, drawn in `lanes` with `colours` """
+        self.num_frames = num_frames
+        self.starts = starts
+        self.stops = stops
+        self.lanes = lanes
+        self.num_lanes = num_lanes
+        self.colours = colours
+        self.pixmap = None
+        self.update()
+
+    def set_marks(self, starts, stops):
+        """ Marks frames `starts` to `stops` """
+        self.marks = (starts, stops)
+        self.pixmap = None
+        self.update()
+
+    def clear(self):
+        self.marks = ([], [])
+        self.set_intervals(0, [], [], [], 0, [])
+        self.frame = None
+
+    def set_frame(self, frame):
+        """ Moves the cursor to `frame`, repainting only the old and new cursor positions """
+        if frame == self.frame:
+            return
+        for f in (self.frame, frame):
+            if f is not None:
+                self.update(QRect(self.frame_x(f) - 1, 0, 3, self.height()))
+        self.frame = frame
+
+    def frame_x(self, frame):
+        return int(frame * self.width() / max(self.num_frames, 1))
+
+    def render_intervals(self):
+        pixmap = QPixmap(self.size())
+        pixmap.fill(QColor(40, 40, 40))
+        if self.num_lanes:
+            painter = QPainter(pixmap)
+            lane_height = max(self.height() // self.num_lanes, 1)
+            for start, stop, lane, colour in zip(self.starts, self.stops, self.lanes, self.colours):
+                x = self.frame_x(start)
+                painter.fillRect(x, lane * lane_height, max(self.frame_x(stop + 1) - x, 1), lane_height, colour)
+            painter.end()
+        if len(self.marks[0]):
+            painter = QPainter(pixmap)
+            for start, stop in zip(*self.marks):
+                x = self.frame_x(start)
+                painter.fillRect(x, self.height() - 3, max(self.frame_x(stop + 1) - x, 1), 3, Qt.red)
+            painter.end()
+        return pixmap
+
+    def paintEvent(self, event):
+        if self.pixmap is None or self.pixmap.size() != self.size():
+            self.pixmap = self.render_intervals()
+        painter = QPainter(self)
+        painter.drawPixmap(event.rect(), self.pixmap, event.rect())
+        if self.frame is not None:
+            painter.setPen(Qt.white)
+            x = self.frame_x(self.frame)
+            painter.drawLine(x, 0, x, self.height())
+
+    def mousePressEvent(self, event):
+        if self.num_frames:
+            self.frame_clicked.emit(min(int(event.x() * self.num_frames / max(self.width(), 1)), self.num_frames - 1))
@@ -0,0 +1,295 @@
+import os.path as osp
+
+import numpy as np
+import pandas as pd
+
+from cache import source_signature, is_cache_fresh, load_cached_array, save_cached_array
+
+TRACKING_CACHE_VERSION = 3
+TRACKING_CACHE_SUFFIX = '.tracking.npy'
+TRACKS_CACHE_SUFFIX = '.tracks.npy'
+TRACKING_RECORD_DTYPE = np.dtype([('frame', '<i4'), ('player_id', '<i4'), ('box', '<f4', (4,))])
+
+
+def tracking_cache_path(tracking_txt_path):
+    """ Returns path of the binary cache sitting next to `tracking_txt_path` """
+    return osp.splitext(tracking_txt_path)[0] + TRACKING_CACHE_SUFFIX
+
+
+def tracks_cache_path(tracking_txt_path):
+    """ Returns path of the binary cache of the player-sorted rows of `tracking_txt_path`, used by `TrackIndex` """
+    return osp.splitext(tracking_txt_path)[0] + TRACKS_CACHE_SUFFIX
+
+
+def is_tracking_cache_fresh(tracking_txt_path):
+    """ Checks that both binary caches of `tracking_txt_path` are up to date """
+    return all(is_cache_fresh(path, tracking_txt_path, TRACKING_CACHE_VERSION)
+               for path in (tracking_cache_path(tracking_txt_path), tracks_cache_path(tracking_txt_path)))
+
+
+class TrackingIndex(object):
+    """Per-frame index over the rows of a tracking .txt file.
+
+    Rows are sorted by frame number once, so every box of a given frame lives in one contiguous slice of the column
+    arrays. ``frame_numbers`` holds the distinct frames present in the file and ``offsets`` the slice boundaries, i.e.
+    the boxes of ``frame_numbers[i]`` are rows ``offsets[i]:offsets[i + 1]``. Looking up a frame is a binary search,
+    so hit tests cost the same regardless of video length.
+
+    Columns are stored with the types of `TRACKING_RECORD_DTYPE`, 24 bytes per row
+        - frames: frame number of each row (int32)
+        - player_ids: tracking id of each row (int32)
+        - boxes: x1 (top left), y1 (top left), width, height in pixels (float32)
+
+    """
+
+    def __init__(self, frames, player_ids, boxes, presorted=False):
+        # no copy when already of these types, e.g. columns of the memory mapped cache, which are viewed as plain
+        # arrays: operations on np.memmap instances are several times slower
+        self.mapped = presorted and isinstance(frames, np.memmap)
+        frames = np.asarray(frames, dtype=TRACKING_RECORD_DTYPE['frame'])
+        player_ids = np.asarray(player_ids, dtype=TRACKING_RECORD_DTYPE['player_id'])
+        boxes = np.asarray(boxes, dtype=TRACKING_RECORD_DTYPE['box'].base)
+        if not presorted:
+            order = np.argsort(frames, kind='stable')  # stable keeps file order within a frame
+            frames, player_ids, boxes = frames[order], player_ids[order], boxes[order]
+        self.frames = frames
+        self.player_ids = player_ids
+        self.boxes = boxes
+
+        # frames are sorted, so each new frame number starts where consecutive rows differ
+        starts = np.flatnonzero(np.diff(self.frames)) + 1
+        starts = np.concatenate(([0], starts)) if len(self.frames) else starts
+        self.frame_numbers = np.asarray(self.frames[starts])
+        self.offsets = np.append(starts, len(self.frames))
+        self._tracks = None
+
+    @property
+    def tracks(self):
+        """ `TrackIndex` over the same rows, built on first use """
+        if self._tracks is None:
+            self._tracks = TrackIndex(self.frames, self.player_ids, self.boxes)
+        return self._tracks
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def nbytes(self):
+        """ Memory held by this index, not counting memory mapped cache columns, which are paged in on demand """
+        nbytes = self.frame_numbers.nbytes + self.offsets.nbytes
+        if not self.mapped:
+            nbytes += self.frames.nbytes + self.player_ids.nbytes + self.boxes.nbytes
+        return nbytes + (self._tracks.nbytes if self._tracks is not None else 0)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """ Builds index from an (n, >=6) array of rows: frame_num, player_id, x1, y1, w, h, ... """
+        rows = np.asarray(rows, dtype=np.float64)
+        if rows.size == 0:
+            rows = rows.reshape(0, 6)
+        return cls(rows[:, 0], rows[:, 1], rows[:, 2:6])
+
+    @classmethod
+    def from_txt(cls, tracking_txt_path):
+        """ Reads a tracking .txt file and builds its index """
+        df = pd.read_csv(tracking_txt_path)
+        return cls.from_rows(df.iloc[:, :6].to_numpy(dtype=np.float64))
+
+    @classmethod
+    def from_records(cls, records, track_records=None):
+        """Builds index from a frame-sorted array of `TRACKING_RECORD_DTYPE`, without copying it.
+
+        ``track_records`` are the same rows sorted by player then frame, which back `tracks` without sorting them again.
+        """
+        index = cls(records['frame'], records['player_id'], records['box'], presorted=True)
+        if track_records is not None:
+            index._tracks = TrackIndex.from_records(track_records)
+        return index
+
+    @classmethod
+    def load(cls, tracking_txt_path, use_cache=True):
+        """Loads tracking index of `tracking_txt_path` from its binary cache, (re)building the cache if needed.
+
+        The cache is memory mapped, so loading is near-instant and rows are only paged in when a frame is looked up.
+        So is the cache of player-sorted rows behind `tracks`.
+        """
+        if not use_cache:
+            return cls.from_txt(tracking_txt_path)
+
+        records = load_cached_array(tracking_cache_path(tracking_txt_path), tracking_txt_path, TRACKING_CACHE_VERSION)
+        track_records = load_cached_array(tracks_cache_path(tracking_txt_path), tracking_txt_path,
+                                          TRACKING_CACHE_VERSION)
+        if records is not None and track_records is not None:
+            return cls.from_records(records, track_records)
+
+        return cls.build_cache(tracking_txt_path)
+
+    @classmethod
+    def build_cache(cls, tracking_txt_path):
+        """ Parses `tracking_txt_path`, writes its binary caches and returns the resulting index """
+        signature = source_signature(tracking_txt_path)
+        index = cls.from_txt(tracking_txt_path)
+        try:
+            save_cached_array(tracking_cache_path(tracking_txt_path), signature, index.to_records(),
+                              TRACKING_CACHE_VERSION)
+            save_cached_array(tracks_cache_path(tracking_txt_path), signature, index.tracks.to_records(),
+                              TRACKING_CACHE_VERSION)
+        except OSError as e:
+            print("Could not write tracking cache for {}: {}".format(tracking_txt_path, e))
+        return index
+
+    def to_records(self):
+        """ Returns rows as a frame-sorted array of `TRACKING_RECORD_DTYPE` """
+        records = np.empty(len(self.frames), dtype=TRACKING_RECORD_DTYPE)
+        records['frame'] = self.frames
+        records['player_id'] = self.player_ids
+        records['box'] = self.boxes
+        return records
+
+    def frame_slice(self, frame_num):
+        """ Returns slice of rows belonging to `frame_num` (empty slice if frame has no boxes) """
+        i = np.searchsorted(self.frame_numbers, frame_num)
+        if i == len(self.frame_numbers) or self.frame_numbers[i] != frame_num:
+            return slice(0, 0)
+        return slice(self.offsets[i], self.offsets[i + 1])
+
+    def boxes_at(self, frame_num):
+        """ Returns (player_ids, boxes) of every box in `frame_num` """
+        s = self.frame_slice(frame_num)
+        return self.player_ids[s], self.boxes[s]
+
+    def player_box(self, frame_num, player_id):
+        """ Returns box (x1, y1, w, h) of `player_id` in `frame_num`, or None if the player is not tracked there """
+        player_ids, boxes = self.boxes_at(frame_num)
+        hits = np.flatnonzero(player_ids == player_id)
+        return boxes[hits[0]] if len(hits) else None
+
+    def hit_test(self, frame_num, x, y, vid_width, vid_height, mode='smallest'):
+        """Returns player id of the box containing normalized point (`x`, `y`) in `frame_num`, or -1 if none does.
+
+        When several boxes contain the point, ``mode`` chooses between the ``'smallest'`` box (by area) and the
+        ``'topmost'`` box, i.e. the last one listed in the tracking file, which is the one drawn on top.
+        """
+        player_ids, boxes = self.boxes_at(frame_num)
+        if len(boxes) == 0:
+            return -1
+
+        x1 = boxes[:, 0] / vid_width
+        y1 = boxes[:, 1] / vid_height
+        x2 = (boxes[:, 0] + boxes[:, 2]) / vid_width
+        y2 = (boxes[:, 1] + boxes[:, 3]) / vid_height
+        hits = np.flatnonzero((x1 < x) & (x < x2) & (y1 < y) & (y < y2))
+
+        if len(hits) == 0:
+            return -1
+        if mode == 'smallest':
+            best = hits[np.argmin(boxes[hits, 2] * boxes[hits, 3])]
+        elif mode == 'topmost':
+            best = hits[-1]
+        else:
+            raise ValueError("Unknown hit test mode: {}".format(mode))
+        return int(player_ids[best])
+
+
+class TrackIndex(object):
+    """Per-player index over tracking rows: the frames and boxes of each track, sorted by frame.
+
+    Rows are sorted by player id then frame, so a track is one contiguous slice of ``frames`` and ``boxes``;
+    ``player_ids`` holds the distinct ids and ``offsets`` the slice boundaries, as in `TrackingIndex`. Finding a track,
+    or a frame within it, is a binary search. The segments of consecutive frames of a track are computed on first use
+    and kept, so jumping between appearances of a player is a binary search too.
+    """
+
+    def __init__(self, frames, player_ids, boxes, presorted=False):
+        # as in `TrackingIndex`, columns of the memory mapped cache are viewed rather than copied
+        self.mapped = presorted and isinstance(frames, np.memmap)
+        if presorted:
+            self.frames, self.boxes, ids = np.asarray(frames), np.asarray(boxes), np.asarray(player_ids)
+        else:
+            order = np.lexsort((frames, player_ids))
+            self.frames = np.asarray(frames[order])
+            self.boxes = np.asarray(boxes[order])
+            ids = np.asarray(player_ids[order])
+
+        starts = np.flatnonzero(np.diff(ids)) + 1
+        starts = np.concatenate(([0], starts)) if len(ids) else starts
+        self.player_ids = ids[starts]
+        self.offsets = np.append(starts, len(ids))
+        self._segments = {}
+
+    @property
+    def nbytes(self):
+        """ Memory held by this index, not counting memory mapped cache columns, which are paged in on demand """
+        nbytes = self.player_ids.nbytes + self.offsets.nbytes
+        if not self.mapped:
+            nbytes += self.frames.nbytes + self.boxes.nbytes
+        return nbytes
+
+    @classmethod
+    def from_records(cls, records):
+        """ Builds index from an array of `TRACKING_RECORD_DTYPE` sorted by player then frame, without copying it """
+        return cls(records['frame'], records['player_id'], records['box'], presorted=True)
+
+    def to_records(self):
+        """ Returns rows as an array of `TRACKING_RECORD_DTYPE` sorted by player then frame """
+        records = np.empty(len(self.frames), dtype=TRACKING_RECORD_DTYPE)
+        records['frame'] = self.frames
+        records['player_id'] = np.repeat(self.player_ids, np.diff(self.offsets))
+        records['box'] = self.boxes
+        return records
+
+    def track_slice(self, player_id):
+        """ Returns slice of rows of `player_id` (empty slice if the player is never tracked) """
+        i = np.searchsorted(self.player_ids, player_id)
+        if i == len(self.player_ids) or self.player_ids[i] != player_id:
+            return slice(0, 0)
+        return slice(self.offsets[i], self.offsets[i + 1])
+
+    def track(self, player_id):
+        """ Returns (frames, boxes) of `player_id`, sorted by frame """
+        s = self.track_slice(player_id)
+        return self.frames[s], self.boxes[s]
+
+    def segments(self, player_id):
+        """ Returns (starts, stops): first and last frame of each run of consecutive frames tracking `player_id` """
+        if player_id not in self._segments:
+            frames = self.track(player_id)[0]
+            breaks = np.flatnonzero(np.diff(frames) > 1)
+            starts = frames[np.concatenate(([0], breaks + 1))] if len(frames) else frames
+            stops = frames[np.append(breaks, len(frames) - 1)] if len(frames) else frames
+            self._segments[player_id] = (starts, stops)
+        return self._segments[player_id]
+
+    def first_frame(self, player_id):
+        """ Returns first frame where `player_id` is tracked, or None """
+        frames = self.track(player_id)[0]
+        return int(frames[0]) if len(frames) else None
+
+    def next_appearance(self, player_id, frame_num):
+        """ Returns first frame after `frame_num` where `player_id` appears after not being tracked, or None """
+        starts, _ = self.segments(player_id)
+        i = np.searchsorted(starts, frame_num, side='right')
+        return int(starts[i]) if i < len(starts) else None
+
+    def previous_appearance(self, player_id, frame_num):
+        """ Returns last frame before `frame_num` where `player_id` appears after not being tracked, or None """
+        starts, _ = self.segments(player_id)
+        i = np.searchsorted(starts, frame_num, side='left')
+        return int(starts[i - 1]) if i > 0 else None
+
+    def gaps(self, player_id):
+        """ Returns (starts, stops): first and last frame of each gap of `player_id`'s track """
+        starts, stops = self.segments(player_id)
+        return stops[:-1] + 1, starts[1:] - 1
+
+    def track_stats(self, player_id, start_frame, stop_frame):
+        """Returns (coverage, mean box width, mean box height) of `player_id` from `start_frame` to `stop_frame`.
+
+        Coverage is the fraction of those frames where the player is tracked. Box sizes are NaN if it never is.
+        """
+        frames, boxes = self.track(player_id)
+        lo, hi = np.searchsorted(frames, start_frame), np.searchsorted(frames, stop_frame, side='right')
+        coverage = min(float(hi - lo) / max(stop_frame - start_frame + 1, 1), 1.)
+        if hi == lo:
+            return coverage, float('nan'), float('nan')
+        return coverage, float(boxes[lo:hi, 2].mean()), float(boxes[lo:hi, 3].mean())
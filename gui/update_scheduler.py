@@ -0,0 +1,71 @@
+import time
+
+from PyQt5.QtCore import QObject, QTimer
+from PyQt5.QtGui import QGuiApplication
+
+from profiling import profiler
+
+
+class Subscriber(object):
+
+    def __init__(self, callback, interval):
+        self.callback = callback
+        self.interval = interval  # seconds
+        self.last_time = float('-inf')
+        self.position = None  # last position passed to `callback`
+
+
+class UpdateScheduler(QObject):
+    """Coalesces playback position changes into UI updates at a bounded rate.
+
+    The media player reports its position far more often than the screen refreshes. `notify` only records the latest
+    position; subscribers are called with it on the next tick of a timer running at the display refresh rate, and
+    each subscriber at most once every ``interval_ms`` given to `subscribe`. A position notified while the timer is
+    idle is delivered immediately, so single seeks and frame steps are not delayed; the timer then runs until every
+    subscriber is up to date.
+    """
+
+    def __init__(self, tick_ms=None, parent=None):
+        super(UpdateScheduler, self).__init__(parent)
+        if tick_ms is None:
+            screen = QGuiApplication.primaryScreen()
+            refresh_rate = screen.refreshRate() if screen is not None else 0
+            tick_ms = 1000. / refresh_rate if refresh_rate > 0 else 1000. / 60
+        self.subscribers = []
+        self.position = None
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(max(int(tick_ms), 1))
+        self.timer.timeout.connect(self.tick)
+
+    def subscribe(self, callback, interval_ms=0):
+        """ Calls `callback(position)` after position changes, at most once every `interval_ms` (and display tick) """
+        self.subscribers.append(Subscriber(callback, interval_ms / 1000.))
+
+    def notify(self, position):
+        """ Records new playback `position` (ms) """
+        self.position = position
+        if not self.timer.isActive():
+            self.tick()
+            self.timer.start()
+
+    def invalidate(self):
+        """ Makes every subscriber update on the next notification, even if the position did not change """
+        for subscriber in self.subscribers:
+            subscriber.position = None
+
+    def tick(self):
+        now = time.monotonic()
+        pending = False
+        for subscriber in self.subscribers:
+            if subscriber.position == self.position:
+                continue
+            if now - subscriber.last_time < subscriber.interval:
+                pending = True
+                continue
+            subscriber.last_time = now
+            subscriber.position = self.position
+            with profiler.span('position_update'):
+                subscriber.callback(self.position)
+        if not pending:
+            self.timer.stop()
@@ -0,0 +1,119 @@
+"""Checks that the player of every annotation is tracked over the annotated frames.
+
+Usage
+    python validate_annotations.py <root_dir> [--workers N] [--min-coverage 0.9] [--dry-run]
+
+The annotator fills the ``track_coverage``, ``box_w_mean`` and ``box_h_mean`` columns of each annotation it adds:
+the fraction of frames from ``start_frame`` to ``stop_frame`` where the annotated player id is tracked, and the mean
+size of its boxes over those frames. This command recomputes them for every annotation of the dataset, e.g. after
+tracking files were regenerated or for annotations made before the columns existed, and lists the annotations whose
+coverage is below ``--min-coverage``. Videos are processed in parallel, one per worker.
+
+The annotations are rewritten in place: with per-video csv files, run it while no annotator has the dataset open.
+With the annotations database, each video is updated in one transaction.
+"""
+import os
+import sys
+import time
+import argparse
+import os.path as osp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from tracking import TrackingIndex
+from intervals import frame_number, START_FRAME_COL, STOP_FRAME_COL
+from annotation_store import AnnotationLog, list_annotation_files
+from annotation_db import AnnotationDB, db_path
+
+MIN_COVERAGE = 0.9  # annotations whose player is tracked on fewer of their frames are reported
+
+
+def validate_row(tracks, row):
+    """ Returns [track_coverage, box_w_mean, box_h_mean] of annotation `row`, given the video's `TrackIndex` """
+    start, stop = frame_number(row[START_FRAME_COL]), frame_number(row[STOP_FRAME_COL])
+    if start < 0:
+        return [float('nan')] * 3
+    coverage, box_w, box_h = tracks.track_stats(int(row[2]), start, max(stop, start))
+    return [round(coverage, 3), round(box_w, 1), round(box_h, 1)]
+
+
+def validate_rows(tracks, annotations_list):
+    """ Returns `annotations_list` with the validation columns of every row recomputed """
+    return [list(row[:-3]) + validate_row(tracks, row) for row in annotations_list]
+
+
+def low_coverage(annotations_list, min_coverage):
+    """ Returns (index, row) of the annotations tracked on less than `min_coverage` of their frames """
+    return [(i, row) for i, row in enumerate(annotations_list) if not row[-3] >= min_coverage]
+
+
+def validate_video(name, tracking_txt_path, csv_path, db_file, min_coverage, dry_run):
+    """ Recomputes the validation columns of video `name`, returns (number of annotations, low coverage ones) """
+    tracks = TrackingIndex.load(tracking_txt_path).tracks
+    result = {}
+
+    def update(annotations_list, annotations_col_names):
+        result['rows'] = validate_rows(tracks, annotations_list)
+        return result['rows']
+
+    if db_file is not None:
+        db = AnnotationDB(db_file)
+        if dry_run:
+            update(*db.load(name))
+        else:
+            db.update_video(name, update)
+    else:
+        log = AnnotationLog(csv_path)
+        annotations_list, annotations_col_names = log.load()
+        update(annotations_list, annotations_col_names)
+        if not dry_run:
+            log.compact(result['rows'], annotations_col_names)
+    return len(result['rows']), low_coverage(result['rows'], min_coverage)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Recompute the track coverage of every annotation of a dataset')
+    parser.add_argument('root_dir', help='directory containing the videos_tracked and annotations folders')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--min-coverage', type=float, default=MIN_COVERAGE,
+                        help='report annotations tracked on fewer of their frames')
+    parser.add_argument('--dry-run', action='store_true', help='report without rewriting the annotations')
+    args = parser.parse_args(argv)
+
+    videos_tracked_dir = osp.join(args.root_dir, 'videos_tracked')
+    db_file = db_path(args.root_dir) if osp.exists(db_path(args.root_dir)) else None
+    if db_file is not None:
+        todo = [(name, None) for name in AnnotationDB(db_file).videos()]
+    else:
+        todo = [(osp.splitext(osp.basename(path))[0], path)
+                for path in list_annotation_files(osp.join(args.root_dir, 'annotations'))]
+    print("Validating annotations of {} videos".format(len(todo)))
+
+    num_failed = num_rows = num_low = 0
+    start_time = time.time()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(validate_video, name, osp.join(videos_tracked_dir, name, name + '.txt'), path,
+                                   db_file, args.min_coverage, args.dry_run): name for name, path in todo}
+        for i, future in enumerate(as_completed(futures)):
+            name = futures[future]
+            try:
+                n, low = future.result()
+            except Exception as e:
+                num_failed += 1
+                print("[{}/{}] FAILED {}: {}".format(i + 1, len(todo), name, e))
+                continue
+            num_rows += n
+            num_low += len(low)
+            print("[{}/{}] {}: {} annotations, {} below {:.0%} coverage ({:.0f}s elapsed)".format(
+                i + 1, len(todo), name, n, len(low), args.min_coverage, time.time() - start_time))
+            for index, row in low:
+                print("    #{} {} player {} frames {}-{}: {}".format(
+                    index, row[1], row[2], row[START_FRAME_COL], row[STOP_FRAME_COL],
+                    'no frames' if row[-3] != row[-3] else '{:.0%} tracked'.format(row[-3])))
+
+    print("Done: {} annotations validated, {} below {:.0%} coverage, {} videos failed".format(
+        num_rows, num_low, args.min_coverage, num_failed))
+    return 1 if num_failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+from PyQt5.QtGui import QColor, QFont, QImage, QPen, QPixmap
+from PyQt5.QtCore import Qt, QPointF, QRectF, QSizeF
+from PyQt5.QtMultimediaWidgets import QGraphicsVideoItem
+from PyQt5.QtWidgets import QGraphicsItem, QGraphicsPixmapItem, QGraphicsScene, QGraphicsView, QFrame, QSizePolicy
+
+
+class BoxOverlayItem(QGraphicsItem):
+    """Tracking boxes and ids of one frame, drawn in a single paint call.
+
+    Boxes are set as pixel coordinates of the source video and mapped onto ``video_rect``, the scene rectangle the
+    video is displayed in.
+    """
+
+    def __init__(self, parent=None):
+        super(BoxOverlayItem, self).__init__(parent)
+        self.video_rect = QRectF()
+        self.source_size = QSizeF(1, 1)
+        self.player_ids = []
+        self.boxes = []
+        self.rects = []
+        self.labels = []
+
+        self.pen = QPen(QColor(0, 255, 0), 1)
+        self.pen.setCosmetic(True)
+        self.font = QFont('Arial', 8)
+
+    def boundingRect(self):
+        return self.video_rect.adjusted(0, -12, 0, 0)  # room for labels of boxes touching the top edge
+
+    def set_geometry(self, video_rect, source_size):
+        """ Sets scene rectangle the video is displayed in and pixel size of the source video """
+        self.prepareGeometryChange()
+        self.video_rect = video_rect
+        self.source_size = source_size
+        self.layout_boxes()
+
+    def set_boxes(self, player_ids, boxes):
+        """ Replaces drawn boxes by `boxes` (x1, y1, w, h in source pixels) labelled with `player_ids` """
+        self.player_ids = player_ids.tolist()
+        self.boxes = boxes.tolist()
+        self.layout_boxes()
+
+    def clear(self):
+        self.player_ids = []
+        self.boxes = []
+        self.layout_boxes()
+
+    def layout_boxes(self):
+        """ Maps boxes to scene coordinates, once per frame or resize rather than on every paint """
+        sx = self.video_rect.width() / max(self.source_size.width(), 1)
+        sy = self.video_rect.height() / max(self.source_size.height(), 1)
+        x0, y0 = self.video_rect.x(), self.video_rect.y()
+        self.rects = [QRectF(x0 + x1 * sx, y0 + y1 * sy, w * sx, h * sy) for x1, y1, w, h in self.boxes]
+        self.labels = [str(player_id) for player_id in self.player_ids]
+        self.update()
+
+    def paint(self, painter, option, widget=None):
+        if not self.rects:
+            return
+        painter.setPen(self.pen)
+        painter.setFont(self.font)
+        painter.drawRects(self.rects)
+        for rect, label in zip(self.rects, self.labels):
+            painter.drawText(rect.topLeft() + QPointF(0, -2), label)
+
+
+class VideoView(QGraphicsView):
+    """Video pane: the media player's video item, a still frame item and the box overlay in one scene.
+
+    The still frame item displays decoded frames (e.g. while frame stepping) in place of the video item. Both are
+    fitted into the view keeping the source aspect ratio, and the overlay is drawn over whichever is visible. Mouse
+    presses are left to the parent widget.
+    """
+
+    def __init__(self, parent=None):
+        super(VideoView, self).__init__(parent)
+        self.source_size = QSizeF(16, 9)
+
+        self.setScene(QGraphicsScene(self))
+        self.setFrameShape(QFrame.NoFrame)
+        self.setBackgroundBrush(Qt.black)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.setViewportUpdateMode(QGraphicsView.MinimalViewportUpdate)
+
+        self.video_item = QGraphicsVideoItem()
+        self.frame_item = QGraphicsPixmapItem()
+        self.frame_item.setTransformationMode(Qt.FastTransformation)
+        self.frame_item.setVisible(False)
+        self.overlay_item = BoxOverlayItem()
+        for z, item in enumerate((self.video_item, self.frame_item, self.overlay_item)):
+            item.setZValue(z)
+            self.scene().addItem(item)
+
+    def set_source_size(self, width, height):
+        """ Sets pixel size of the video being displayed """
+        self.source_size = QSizeF(width, height)
+        self.update_geometry()
+
+    def video_rect(self):
+        """ Returns scene rectangle the video is displayed in (fitted into the view, keeping its aspect ratio) """
+        size = self.source_size.scaled(QSizeF(self.viewport().size()), Qt.KeepAspectRatio)
+        return QRectF((self.viewport().width() - size.width()) / 2, (self.viewport().height() - size.height()) / 2,
+                      size.width(), size.height())
+
+    def update_geometry(self):
+        view_rect = QRectF(self.viewport().rect())
+        self.scene().setSceneRect(view_rect)
+        self.video_item.setPos(0, 0)
+        self.video_item.setSize(view_rect.size())
+
+        video_rect = self.video_rect()
+        self.overlay_item.set_geometry(video_rect, self.source_size)
+        pixmap = self.frame_item.pixmap()
+        if not pixmap.isNull():
+            self.frame_item.setPos(video_rect.topLeft())
+            self.frame_item.setScale(video_rect.width() / max(pixmap.width(), 1))
+
+    def show_frame(self, image):
+        """ Displays decoded (BGR) frame `image` instead of the video item """
+        height, width = image.shape[:2]
+        qimage = QImage(image.data, width, height, image.strides[0], QImage.Format_BGR888)
+        self.frame_item.setPixmap(QPixmap.fromImage(qimage))
+        self.update_geometry()
+        self.frame_item.setVisible(True)
+
+    def show_video(self):
+        """ Displays the media player's video item again """
+        self.frame_item.setVisible(False)
+
+    def set_boxes(self, player_ids, boxes):
+        """ Draws tracking `boxes` (x1, y1, w, h in source pixels) labelled with `player_ids` over the video """
+        self.overlay_item.set_boxes(player_ids, boxes)
+
+    def clear_boxes(self):
+        self.overlay_item.clear()
+
+    def set_overlay_visible(self, visible):
+        self.overlay_item.setVisible(visible)
+
+    def resizeEvent(self, event):
+        super(VideoView, self).resizeEvent(event)
+        self.update_geometry()
+
+    def mousePressEvent(self, event):
+        event.ignore()  # handled by the annotator, in its own coordinates